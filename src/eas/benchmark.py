@@ -0,0 +1,215 @@
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from contextlib import redirect_stdout
+from datetime import UTC, datetime
+from io import StringIO
+from sys import argv
+import chains
+import cost
+import euler
+import image
+import image_path
+import simulate
+import toolpath
+from command import START_OFFSET_STEPS, motor_commands
+from constants import STEPS_PER_PIXEL
+from cost import CostModel
+from lines import SIMPLIFY_TOLERANCE
+from toolfile import iter_commands
+
+IMAGES = [
+    "images/cat.jpg",
+    "images/cat_lines.jpg",
+    "images/square.jpg",
+    "images/square100.jpg",
+]
+RESOLUTIONS = [100, 250, 400]
+COMMAND_FILES = [
+    "cat.jsonl",
+    "cat_diag.jsonl",
+    "cat_square.jsonl",
+    "cool_s.jsonl",
+    "diamond.jsonl",
+    "heart.jsonl",
+    "spiky_cat.jsonl",
+    "spiral.jsonl",
+]
+
+# Metrics where bigger is worse, and how much worse counts as a regression
+REGRESSION_METRICS = {
+    "wall_secs": 0.25,
+    "peak_memory_bytes": 0.25,
+    "commands": 0.05,
+    "travel": 0.05,
+    "reversals": 0.05,
+    "draw_secs": 0.02,
+}
+
+
+PLANNERS = {
+    "toolpath": lambda edges: toolpath.generate_toolpath(edges),
+    "toolpath_cost": lambda edges: toolpath.generate_toolpath(edges, CostModel()),
+    "toolpath_simplified": lambda edges: toolpath.generate_toolpath(
+        edges, CostModel(), simplify_tolerance=SIMPLIFY_TOLERANCE
+    ),
+    "image_path": lambda edges: image_path.generate_path(edges),
+    "chains": lambda edges: chains.generate_toolpath(edges, CostModel()),
+    "euler": lambda edges: euler.generate_toolpath(edges, CostModel()),
+}
+
+
+def measure(planner, edges: np.ndarray) -> tuple[list, float, int]:
+    """
+    Runs a planner on a copy of the edges, returns its commands, the wall
+    clock time and the peak memory it allocated. Memory is measured on a
+    second run as tracing slows everything down.
+    """
+    with redirect_stdout(StringIO()):
+        start = time.perf_counter()
+        commands = planner(edges.copy())
+        wall_secs = time.perf_counter() - start
+
+        tracemalloc.start()
+        planner(edges.copy())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return commands, wall_secs, peak
+
+
+def command_stats(commands: list, edges: np.ndarray, steps_per_pixel: int) -> dict:
+    stats, _ = simulate.simulate(
+        commands, edges, steps_per_pixel, (START_OFFSET_STEPS, START_OFFSET_STEPS)
+    )
+    return {
+        "commands": stats["commands"],
+        "travel": cost.travel(commands) // steps_per_pixel,
+        "reversals": stats["reversals"],
+        "ticks": stats["ticks"],
+        "draw_secs": stats["draw_secs"],
+        "coverage": stats["coverage"],
+        "stray_pixels": stats["stray_pixels"],
+        "overdrawn_passes": stats["overdrawn_passes"],
+    }
+
+
+def bench_planners(
+    images: list[str] = IMAGES,
+    resolutions: list[int] = RESOLUTIONS,
+    planners: dict = PLANNERS,
+) -> list[dict]:
+    results = []
+    for img_path in images:
+        for resolution in resolutions:
+            with redirect_stdout(StringIO()):
+                edges = image.canny(img_path, (resolution, resolution))
+
+            for name, planner in planners.items():
+                commands, wall_secs, peak = measure(planner, edges)
+                # Scored the way main would run it, in motor steps
+                stats = command_stats(motor_commands(commands), edges, STEPS_PER_PIXEL)
+                results.append(
+                    {
+                        "image": img_path,
+                        "resolution": resolution,
+                        "planner": name,
+                        "edge_pixels": int(np.count_nonzero(edges == 255)),
+                        "wall_secs": wall_secs,
+                        "peak_memory_bytes": peak,
+                        **stats,
+                    }
+                )
+                print(
+                    f"{img_path} @ {resolution}, {name}: {wall_secs:.2f} s, "
+                    f"{stats['commands']} commands, "
+                    f"{stats['draw_secs'] / 60:.1f} min"
+                )
+
+    return results
+
+
+def bench_files(files: list[str] = COMMAND_FILES) -> list[dict]:
+    """
+    Stats for the reference command files, there's no edge map to score them
+    against so coverage is left out
+    """
+    results = []
+    for filename in files:
+        commands = list(iter_commands(filename))
+        stats = command_stats(commands, np.zeros((1, 1), np.uint8), STEPS_PER_PIXEL)
+        for key in ("coverage", "stray_pixels", "overdrawn_passes"):
+            del stats[key]
+        results.append({"file": filename, **stats})
+
+    return results
+
+
+def run_key(run: dict) -> tuple:
+    if "file" in run:
+        return ("file", run["file"])
+    return (run["image"], run["resolution"], run["planner"])
+
+
+def compare(old: dict, new: dict) -> list[str]:
+    """
+    Lists the metrics that got worse by more than their threshold between two
+    benchmark results
+    """
+    old_runs = {run_key(run): run for run in old["planners"] + old["files"]}
+    regressions = []
+    for run in new["planners"] + new["files"]:
+        previous = old_runs.get(run_key(run))
+        if previous is None:
+            continue
+
+        for metric, threshold in REGRESSION_METRICS.items():
+            if metric not in run or not previous.get(metric):
+                continue
+            change = run[metric] / previous[metric] - 1
+            if change > threshold:
+                regressions.append(
+                    f"{'/'.join(map(str, run_key(run)))} {metric}: "
+                    f"{previous[metric]:.6g} -> {run[metric]:.6g} ({change:+.0%})"
+                )
+
+    return regressions
+
+
+def main():
+    if len(argv) == 4 and argv[1] == "compare":
+        with open(argv[2]) as file:
+            old = json.load(file)
+        with open(argv[3]) as file:
+            new = json.load(file)
+
+        regressions = compare(old, new)
+        for regression in regressions:
+            print(regression)
+        print(f"{len(regressions)} regressions")
+        sys.exit(1 if regressions else 0)
+
+    if len(argv) > 2:
+        print("Nuh uh! Supply an output file, or compare old.json new.json")
+        return
+
+    results = {
+        "created": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "planners": bench_planners(),
+        "files": bench_files(),
+    }
+
+    out = argv[1] if len(argv) == 2 else "benchmark.json"
+    with open(out, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from command import START_OFFSET_STEPS
+from constants import STEPS_PER_PIXEL
+from toolfile import SUFFIX, VERSION
+
+CACHE_DIR = "cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def plan_key(
+    data: bytes,
+    planner: str,
+    planner_version: int,
+    preprocessing: dict,
+    cost_model: dict | None = None,
+) -> str:
+    """
+    Hash of an image and everything that changes the commands planned for
+    it, preprocessing being the Preprocessor's params and cost_model the
+    CostModel's fields, if it's planned with one
+    """
+    params = {
+        "planner": planner,
+        "planner_version": planner_version,
+        "preprocessing": preprocessing,
+        "cost_model": cost_model,
+        "steps_per_pixel": STEPS_PER_PIXEL,
+        "start_offset_steps": START_OFFSET_STEPS,
+        "toolfile_version": VERSION,
+    }
+
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class ToolpathCache:
+    """
+    Planned command files on disk, named by their key. A file's modification
+    time is when it was last used, and the least recently used files are
+    evicted once the cache grows past max_bytes. get and put can be called
+    from several threads at once. The entry and byte totals are kept as
+    files come and go, so stats never touches the disk.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.entry_count = 0
+        self.size = 0
+        self.evict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{SUFFIX}")
+
+    def get(self, key: str, destination: str) -> bool:
+        """
+        Copies the cached file for key to destination, if there is one
+        """
+        path = self.path(key)
+        with self.lock:
+            try:
+                shutil.copyfile(path, destination)
+            except FileNotFoundError:
+                self.misses += 1
+                return False
+
+            os.utime(path)
+            self.hits += 1
+            return True
+
+    def put(self, key: str, source: str):
+        """
+        Stores a copy of a planned command file under key
+        """
+        # Copied under a temporary name first so a half written file is never
+        # served
+        tmp_path = f"{self.path(key)}.tmp"
+        with self.lock:
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, self.path(key))
+            self.evict()
+
+    def entries(self) -> list[os.DirEntry]:
+        return [
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(SUFFIX)
+        ]
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_mtime)
+        size = sum(entry.stat().st_size for entry in entries)
+
+        count = len(entries)
+
+        for entry in entries:
+            if size <= self.max_bytes:
+                break
+            size -= entry.stat().st_size
+            count -= 1
+            os.remove(entry.path)
+            self.evictions += 1
+
+        self.entry_count = count
+        self.size = size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self.entry_count,
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,456 @@
+import cv2 as cv
+import numpy as np
+from dataclasses import dataclass
+from itertools import pairwise
+from sys import argv
+from command import Command, save_commands
+from cost import CostModel, axis_reversals
+import cost
+
+PLANNER_VERSION = 1
+
+# 4-neighbours first so chains prefer straight runs over diagonal hops
+CHAIN_ORDER = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+MAX_PASSES = 20
+OR_OPT_SEGMENT_LENGTHS = (1, 2, 3)
+
+
+def sign(x: int) -> int:
+    return 1 if x > 0 else -1 if x < 0 else 0
+
+
+def extract_chains(img: np.ndarray) -> list[list[tuple[int, int]]]:
+    """
+    Splits the edge pixels (255) into chains of 8-connected pixels in a single
+    pass. Chains are started from line ends where possible so a stroke isn't
+    cut in half, closed loops are picked up afterwards.
+    """
+    edges = img == 255
+    remaining = edges.copy()
+
+    kernel = np.ones((3, 3), np.float32)
+    kernel[1, 1] = 0
+    neighbours = cv.filter2D(
+        edges.astype(np.uint8), -1, kernel, borderType=cv.BORDER_CONSTANT
+    )
+
+    line_ends = np.argwhere(edges & (neighbours <= 1))
+    chains = []
+    for y, x in np.concatenate((line_ends, np.argwhere(edges))):
+        start = (int(y), int(x))
+        if not remaining[start]:
+            continue
+
+        remaining[start] = False
+        forward = trace_chain(remaining, start)
+        backward = trace_chain(remaining, start)
+        chains.append(backward[::-1] + [start] + forward)
+
+    return chains
+
+
+def trace_chain(remaining: np.ndarray, point: tuple[int, int]) -> list[tuple[int, int]]:
+    """
+    Follows unvisited pixels from point, consuming them, until it runs out.
+    Keeps going straight where it can, and otherwise turns the way that
+    doesn't reverse an axis.
+    """
+    height, width = remaining.shape
+    path = []
+    direction = None
+    state = (0, 0)
+
+    while True:
+        y, x = point
+        best = None
+        for dy, dx in CHAIN_ORDER:
+            ny, nx = y + dy, x + dx
+            if not (0 <= ny < height and 0 <= nx < width and remaining[ny, nx]):
+                continue
+
+            rank = 0 if (dy, dx) == direction else 1 + axis_reversals(state, dx, dy)[0]
+            if best is None or rank < best[0]:
+                best = (rank, dy, dx)
+
+        if best is None:
+            return path
+
+        _, dy, dx = best
+        point = (y + dy, x + dx)
+        remaining[point] = False
+        direction = (dy, dx)
+        state = axis_reversals(state, dx, dy)[1]
+        path.append(point)
+
+
+def distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Chebyshev distance, the number of ticks an 8-direction move takes
+    """
+    return np.abs(a - b).max(axis=-1)
+
+
+def chain_directions(chain: list[tuple[int, int]]) -> tuple[int, int, int, int]:
+    """
+    Returns the first x, first y, last x and last y direction the chain moves
+    in, 0 for an axis it never moves along
+    """
+    hops = np.diff(np.array(chain).reshape(-1, 2), axis=0)
+    moving_x = np.flatnonzero(hops[:, 1])
+    moving_y = np.flatnonzero(hops[:, 0])
+
+    first_x = hops[moving_x[0], 1] if len(moving_x) else 0
+    last_x = hops[moving_x[-1], 1] if len(moving_x) else 0
+    first_y = hops[moving_y[0], 0] if len(moving_y) else 0
+    last_y = hops[moving_y[-1], 0] if len(moving_y) else 0
+
+    return int(first_x), int(first_y), int(last_x), int(last_y)
+
+
+@dataclass
+class Tour:
+    """
+    Order and orientation of the chains, plus what is needed to cost the links
+    between them. Chain directions are (first x, first y, last x, last y).
+    """
+
+    heads: np.ndarray
+    tails: np.ndarray
+    directions: np.ndarray
+    start: np.ndarray
+    cost_model: CostModel | None
+    order: np.ndarray = None
+    flipped: np.ndarray = None
+
+    def points(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns where each chain in the tour starts and ends, and the (x, y)
+        directions it sets off and finishes in
+        """
+        flipped = self.flipped[:, None]
+        directions = self.directions[self.order]
+        starts = np.where(flipped, self.tails[self.order], self.heads[self.order])
+        ends = np.where(flipped, self.heads[self.order], self.tails[self.order])
+        entries = np.where(flipped, -directions[:, 2:], directions[:, :2])
+        exits = np.where(flipped, -directions[:, :2], directions[:, 2:])
+        return starts, ends, entries, exits
+
+    def link_cost(
+        self,
+        ends: np.ndarray,
+        exits: np.ndarray,
+        starts: np.ndarray,
+        entries: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Cost of travelling from the end of one chain to the start of the next.
+        With a cost model, reversals on the way there and when setting off
+        along the next chain are added on.
+
+        Walking both chains the other way round costs the same, so reversing a
+        run of the tour only changes the links at either end of it.
+        """
+        cost = distance(ends, starts)
+        if self.cost_model is None:
+            return cost
+
+        ends, exits, starts, entries = np.broadcast_arrays(ends, exits, starts, entries)
+        step = np.sign(starts - ends)[..., ::-1]
+        # Both axes take up their backlash at once, so it's per move not per axis
+        flips = ((exits != 0) & (step != 0) & (step != exits)).any(axis=-1)
+        moved = np.where(step != 0, step, exits)
+        flips = flips.astype(int) + (
+            (moved != 0) & (entries != 0) & (entries != moved)
+        ).any(axis=-1)
+
+        return cost + flips * self.cost_model.reversal_cost
+
+
+def order_chains(
+    chains: list[list[tuple[int, int]]],
+    start: tuple[int, int] = (0, 0),
+    cost_model: CostModel | None = None,
+) -> list[list[tuple[int, int]]]:
+    """
+    Orders and orients chains to cut the travel between them. Builds a tour with
+    nearest neighbour, then improves it with 2-opt and Or-opt moves. With a
+    cost model, backlash from reversing an axis counts as travel too.
+    """
+    if not chains:
+        return []
+
+    tour = plan_tour(
+        np.array([chain[0] for chain in chains]),
+        np.array([chain[-1] for chain in chains]),
+        np.array([chain_directions(chain) for chain in chains]),
+        start,
+        cost_model,
+    )
+
+    return [
+        chains[i][::-1] if flip else chains[i]
+        for i, flip in zip(tour.order, tour.flipped)
+    ]
+
+
+def plan_tour(
+    heads: np.ndarray,
+    tails: np.ndarray,
+    directions: np.ndarray,
+    start: tuple[int, int] = (0, 0),
+    cost_model: CostModel | None = None,
+) -> Tour:
+    """
+    Tour through anything with two ends that can be walked either way, given
+    its (y, x) ends and (first x, first y, last x, last y) directions
+    """
+    tour = Tour(
+        heads=heads,
+        tails=tails,
+        directions=directions,
+        start=np.array(start),
+        cost_model=cost_model,
+    )
+    nearest_neighbour_tour(tour)
+
+    for _ in range(MAX_PASSES):
+        improved = two_opt(tour)
+        improved |= or_opt(tour)
+        if not improved:
+            break
+
+    return tour
+
+
+def nearest_neighbour_tour(tour: Tour):
+    n = len(tour.heads)
+    unused = np.ones(n, bool)
+    tour.order = np.empty(n, int)
+    tour.flipped = np.empty(n, bool)
+
+    forwards = tour.directions[:, :2]
+    backwards = -tour.directions[:, 2:]
+
+    current = tour.start
+    current_exit = np.zeros(2, int)
+    for k in range(n):
+        head_cost = tour.link_cost(current, current_exit, tour.heads, forwards)
+        tail_cost = tour.link_cost(current, current_exit, tour.tails, backwards)
+        head_cost = np.where(unused, head_cost, np.inf)
+        tail_cost = np.where(unused, tail_cost, np.inf)
+        best_head = int(np.argmin(head_cost))
+        best_tail = int(np.argmin(tail_cost))
+
+        if tail_cost[best_tail] < head_cost[best_head]:
+            tour.order[k], tour.flipped[k] = best_tail, True
+            current = tour.heads[best_tail]
+            current_exit = -tour.directions[best_tail, :2]
+        else:
+            tour.order[k], tour.flipped[k] = best_head, False
+            current = tour.tails[best_head]
+            current_exit = tour.directions[best_head, 2:]
+        unused[tour.order[k]] = False
+
+
+def two_opt(tour: Tour) -> bool:
+    """
+    Reverses runs of the tour (flipping every chain in them) while that
+    shortens it. Updates the tour in place.
+    """
+    n = len(tour.order)
+    improved = False
+
+    for i in range(n):
+        starts, ends, entries, exits = tour.points()
+        prev_end = tour.start if i == 0 else ends[i - 1]
+        prev_exit = np.zeros(2, int) if i == 0 else exits[i - 1]
+
+        # Reversing i..j swaps the links into i and out of j for links into
+        # (reversed) j and out of (reversed) i
+        next_links = tour.link_cost(
+            ends[i:-1], exits[i:-1], starts[i + 1 :], entries[i + 1 :]
+        )
+        old = tour.link_cost(prev_end, prev_exit, starts[i], entries[i]) + np.append(
+            next_links, 0
+        )
+        new = tour.link_cost(prev_end, prev_exit, ends[i:], -exits[i:]) + np.append(
+            tour.link_cost(starts[i], -entries[i], starts[i + 1 :], entries[i + 1 :]),
+            0,
+        )
+        gains = old - new
+
+        j = int(np.argmax(gains))
+        if gains[j] > 1e-9:
+            j += i
+            tour.order[i : j + 1] = tour.order[i : j + 1][::-1].copy()
+            tour.flipped[i : j + 1] = ~tour.flipped[i : j + 1][::-1]
+            improved = True
+
+    return improved
+
+
+def or_opt(tour: Tour) -> bool:
+    """
+    Moves short runs of chains to the gap in the tour where they fit best,
+    optionally reversed. Updates the tour in place.
+    """
+    n = len(tour.order)
+    improved = False
+    link_cost = tour.link_cost
+
+    for length in OR_OPT_SEGMENT_LENGTHS:
+        i = 0
+        while i + length <= n:
+            starts, ends, entries, exits = tour.points()
+            last = i + length - 1
+            prev_end = tour.start if i == 0 else ends[i - 1]
+            prev_exit = np.zeros(2, int) if i == 0 else exits[i - 1]
+
+            # Saving from cutting the run out and joining its neighbours
+            removal = link_cost(prev_end, prev_exit, starts[i], entries[i])
+            if last + 1 < n:
+                removal += link_cost(
+                    ends[last], exits[last], starts[last + 1], entries[last + 1]
+                ) - link_cost(prev_end, prev_exit, starts[last + 1], entries[last + 1])
+
+            # Gaps in the rest of the tour, gap g sits after gap_ends[g]
+            rest = np.r_[0:i, last + 1 : n]
+            gap_ends = np.vstack((tour.start, ends[rest]))
+            gap_exits = np.vstack((np.zeros(2, int), exits[rest]))
+            gap_starts = starts[rest]
+            gap_entries = entries[rest]
+            joined = np.append(
+                link_cost(gap_ends[:-1], gap_exits[:-1], gap_starts, gap_entries), 0
+            )
+
+            forward = link_cost(gap_ends, gap_exits, starts[i], entries[i])
+            forward[:-1] += link_cost(ends[last], exits[last], gap_starts, gap_entries)
+            backward = link_cost(gap_ends, gap_exits, ends[last], -exits[last])
+            backward[:-1] += link_cost(starts[i], -entries[i], gap_starts, gap_entries)
+
+            forward_gap = int(np.argmin(forward - joined))
+            backward_gap = int(np.argmin(backward - joined))
+            forward_cost = (forward - joined)[forward_gap]
+            backward_cost = (backward - joined)[backward_gap]
+            reverse = backward_cost < forward_cost
+            gap = backward_gap if reverse else forward_gap
+
+            if removal - min(forward_cost, backward_cost) > 1e-9:
+                run_order = tour.order[i : last + 1].copy()
+                run_flipped = tour.flipped[i : last + 1].copy()
+                if reverse:
+                    run_order = run_order[::-1]
+                    run_flipped = ~run_flipped[::-1]
+
+                rest_order = tour.order[rest]
+                rest_flipped = tour.flipped[rest]
+                tour.order[:] = np.concatenate(
+                    (rest_order[:gap], run_order, rest_order[gap:])
+                )
+                tour.flipped[:] = np.concatenate(
+                    (rest_flipped[:gap], run_flipped, rest_flipped[gap:])
+                )
+                improved = True
+
+            i += 1
+
+    return improved
+
+
+def points_to_commands(points: list[tuple[int, int]]) -> list[Command]:
+    """
+    Turns a run of neighbouring pixels into commands, merging hops that go the
+    same way
+    """
+    commands = []
+    for (y, x), (next_y, next_x) in pairwise(points):
+        dy, dx = next_y - y, next_x - x
+        if commands and (commands[-1].x, commands[-1].y) == (dx, dy):
+            commands[-1].steps += 1
+        else:
+            commands.append(Command(x=dx, y=dy, steps=1))
+
+    return commands
+
+
+def line_commands(start: tuple[int, int], end: tuple[int, int]) -> list[Command]:
+    """
+    Moves straight from start to end, diagonal first then the remainder
+    """
+    commands = []
+    dy = end[0] - start[0]
+    dx = end[1] - start[1]
+
+    diag_steps = min(abs(dy), abs(dx))
+    if diag_steps > 0:
+        commands.append(Command(x=sign(dx), y=sign(dy), steps=diag_steps))
+
+    straight_steps = max(abs(dy), abs(dx)) - diag_steps
+    if straight_steps > 0:
+        if abs(dx) > abs(dy):
+            commands.append(Command(x=sign(dx), y=0, steps=straight_steps))
+        else:
+            commands.append(Command(x=0, y=sign(dy), steps=straight_steps))
+
+    return commands
+
+
+def chains_to_commands(
+    chains: list[list[tuple[int, int]]], start: tuple[int, int] = (0, 0)
+) -> list[Command]:
+    commands = []
+    current = start
+    for chain in chains:
+        commands.extend(line_commands(current, chain[0]))
+        commands.extend(points_to_commands(chain))
+        current = chain[-1]
+
+    return commands
+
+
+def generate_toolpath(
+    img: np.ndarray, cost_model: CostModel | None = None
+) -> list[Command]:
+    return chains_to_commands(order_chains(extract_chains(img), cost_model=cost_model))
+
+
+def main():
+    if len(argv) not in (2, 3):
+        print("Nuh uh! Supply an image and optionally an output file please")
+        return
+
+    import image
+    import toolpath
+
+    edges = image.canny(argv[1])
+    chains = extract_chains(edges)
+    coms = chains_to_commands(order_chains(chains, cost_model=CostModel()))
+    plain_coms = chains_to_commands(order_chains(chains))
+    greedy_coms = toolpath.generate_toolpath(edges.copy())
+
+    connecting = cost.travel(coms) - sum(len(chain) - 1 for chain in chains)
+    chains_secs = cost.draw_time_secs(coms)
+    greedy_secs = cost.draw_time_secs(greedy_coms)
+
+    print(f"Chains: {len(chains)}, connecting travel: {connecting} px")
+    print(
+        f"Chains planner: {len(coms)} commands, {cost.travel(coms)} px travel, "
+        f"{chains_secs / 60:.1f} min"
+    )
+    print(
+        f"Greedy planner: {len(greedy_coms)} commands, "
+        f"{cost.travel(greedy_coms)} px travel, {greedy_secs / 60:.1f} min"
+    )
+    print(f"Saved: {(greedy_secs - chains_secs) / 60:.1f} min")
+    print(
+        f"Reversals: {cost.reversals(coms)}, "
+        f"{cost.reversals(plain_coms) - cost.reversals(coms)} avoided by the cost model"
+    )
+
+    if len(argv) == 3:
+        save_commands(argv[2], coms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+
+CHECKPOINT_FILE = "eas_checkpoint.json"
+CHECKPOINT_SECS = 1.0  # how often a running job saves its progress
+
+
+@dataclass
+class Checkpoint:
+    """
+    Where a job got to. The axis directions are the ones from before the
+    command at command_index started, so resuming it works out the same
+    backlash compensation, and ticks_done counts its ticks backlash included.
+    The motor sequence indices are the current ones.
+
+    A streamed job's file only has the commands planned so far, so it also
+    keeps the image it was planned from (source), the planner and the
+    Preprocessor params, and resuming plans it again.
+    """
+
+    file: str
+    command_index: int = 0
+    ticks_done: int = 0
+    x_motor_sequence_index: int = 0
+    y_motor_sequence_index: int = 0
+    x_dir: int = 0
+    y_dir: int = 0
+    source: str | None = None
+    planner: str | None = None
+    preprocessing: dict | None = None
+
+
+class Checkpointer:
+    """
+    Saves checkpoints to a file, at most every interval_secs unless told to
+    save now. Files are replaced atomically so a power cut mid write leaves
+    the previous checkpoint.
+    """
+
+    def __init__(
+        self, path: str = CHECKPOINT_FILE, interval_secs: float = CHECKPOINT_SECS
+    ):
+        self.path = path
+        self.interval_secs = interval_secs
+        self.last_save = time.monotonic()
+
+    def due(self) -> bool:
+        return time.monotonic() - self.last_save >= self.interval_secs
+
+    def save(self, checkpoint: Checkpoint):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(asdict(checkpoint), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        self.last_save = time.monotonic()
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_checkpoint(path: str = CHECKPOINT_FILE) -> Checkpoint | None:
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r") as file:
+        return Checkpoint(**json.load(file))
@@ -1,4 +1,9 @@
+import json
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
+from constants import STEPS_PER_PIXEL
+
+START_OFFSET_STEPS = 8192  # moves the pen off the top left corner before drawing
 
 
 # python class containing  x, y and steps vars
@@ -7,3 +12,111 @@ class Command:
     x: int
     y: int
     steps: int
+
+
+# straight line of dx, dy steps, with both axes stepping interleaved
+@dataclass
+class Move:
+    dx: int
+    dy: int
+
+
+def sign(x: int) -> int:
+    return 1 if x > 0 else -1 if x < 0 else 0
+
+
+def delta(com: Command | Move) -> tuple[int, int]:
+    """
+    How far a command moves the pen along x and y
+    """
+    if isinstance(com, Move):
+        return com.dx, com.dy
+    return com.x * com.steps, com.y * com.steps
+
+
+def direction(com: Command | Move) -> tuple[int, int]:
+    """
+    Direction each axis moves in, -1, 0 or 1
+    """
+    if isinstance(com, Move):
+        return sign(com.dx), sign(com.dy)
+    return com.x, com.y
+
+
+def length(com: Command | Move) -> int:
+    """
+    Number of ticks the command takes, leaving backlash aside
+    """
+    if isinstance(com, Move):
+        return max(abs(com.dx), abs(com.dy))
+    return abs(com.steps)
+
+
+def scale(com: Command | Move, factor: int) -> Command | Move:
+    if isinstance(com, Move):
+        return Move(dx=com.dx * factor, dy=com.dy * factor)
+    return Command(x=com.x, y=com.y, steps=abs(com.steps) * factor)
+
+
+def to_dict(com: Command | Move) -> dict:
+    if isinstance(com, Move):
+        return {"dx": com.dx, "dy": com.dy}
+    return {"steps": com.steps, "x_dir": com.x, "y_dir": com.y}
+
+
+def from_dict(inst: dict) -> Command | Move:
+    if "dx" in inst:
+        return Move(dx=inst["dx"], dy=inst["dy"])
+    return Command(x=inst["x_dir"], y=inst["y_dir"], steps=inst["steps"])
+
+
+def iter_jsonl(filename: str) -> Iterator[Command | Move]:
+    """
+    Reads a JSONL file one command at a time
+    """
+    with open(filename, "r") as file:
+        for line in file:
+            if line.strip():
+                yield from_dict(json.loads(line))
+
+
+def load_commands(filename: str) -> list[Command | Move]:
+    return list(iter_jsonl(filename))
+
+
+def write_commands(filename: str, commands: Iterable[Command | Move]) -> int:
+    """
+    Writes commands as they are, steps are motor steps. Returns the number
+    written.
+    """
+    count = 0
+    with open(filename, "w") as file:
+        for com in commands:
+            file.write(f"{json.dumps(to_dict(com))}\n")
+            count += 1
+    return count
+
+
+def motor_commands(commands: list[Command | Move]) -> list[Command | Move]:
+    """
+    Turns pixel commands into motor step commands, starting off the corner
+    """
+    return list(iter_motor_commands(commands))
+
+
+def iter_motor_commands(
+    commands: Iterable[Command | Move],
+) -> Iterator[Command | Move]:
+    """
+    motor_commands for commands that are still being planned
+    """
+    yield Command(x=1, y=1, steps=START_OFFSET_STEPS)
+    for com in commands:
+        yield scale(com, STEPS_PER_PIXEL)
+
+
+def save_commands(filename: str, commands: list[Command | Move]):
+    """
+    Writes pixel commands as a JSONL file of motor steps
+    """
+    write_commands(filename, motor_commands(commands))
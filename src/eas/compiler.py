@@ -0,0 +1,291 @@
+import numpy as np
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from sys import argv
+from command import Command, Move, sign
+from plotter import STEP_MASKS, Axis, Direction, Plotter
+from scheduler import trapezoid_periods
+
+# A tick's pin levels after it, x pins in the low 4 bits and y in the high 4,
+# which of them it changed, the axes' sequence indices after it (x low, y
+# high) and how long to wait before the next tick
+TICK_DTYPE = np.dtype(
+    [("levels", "u1"), ("changed", "u1"), ("sequence", "u1"), ("period", "<f8")]
+)
+
+SEQUENCE_MASKS = np.array(STEP_MASKS, np.uint8)
+
+# Bits set in every byte, so writing the changed pins is a lookup
+CHANGED_BITS = [
+    [bit for bit in range(8) if changed >> bit & 1] for changed in range(256)
+]
+
+
+@dataclass
+class CompiledCommands:
+    """
+    Commands compiled into ticks. The ticks for command i are
+    ticks[starts[i] : starts[i + 1]], and directions[i] is the (x, y) axis
+    directions before it, with the ones after the last command at the end.
+    """
+
+    ticks: np.ndarray
+    starts: np.ndarray
+    directions: np.ndarray
+
+
+def motor_steps(
+    step_count: int, x_backlash: int, y_backlash: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Which ticks of Plotter.motor_ticks step x and which step y. The axis with
+    more to do steps every tick, the other joins in for its last steps. y
+    checks its fuel after x has taken a step off its own, so when x has more
+    it joins in a tick early and steps once more than it was given.
+    """
+    x_fuel = step_count + x_backlash
+    y_fuel = step_count + y_backlash
+    tick = np.arange(max(x_fuel, y_fuel))
+    ticks = len(tick)
+    return tick >= ticks - x_fuel, tick >= ticks - y_fuel - (x_fuel > y_fuel)
+
+
+def vector_steps(
+    dx: int, dy: int, x_backlash: int, y_backlash: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Which ticks of Plotter.vector_ticks step x and which step y
+    """
+    backlash_ticks = max(x_backlash, y_backlash)
+    line_ticks = max(abs(dx), abs(dy))
+    backlash_tick = np.arange(backlash_ticks)
+
+    # An axis has stepped (line_ticks // 2 + tick * its distance) // line_ticks
+    # times after a tick of the line, it steps whenever that goes up
+    line_tick = np.arange(line_ticks + 1)
+    x_line = np.diff((line_ticks // 2 + line_tick * abs(dx)) // max(line_ticks, 1)) > 0
+    y_line = np.diff((line_ticks // 2 + line_tick * abs(dy)) // max(line_ticks, 1)) > 0
+
+    return (
+        np.concatenate((backlash_tick < x_backlash, x_line)),
+        np.concatenate((backlash_tick < y_backlash, y_line)),
+    )
+
+
+def axis_levels(
+    axis: Axis, steps: np.ndarray, moves: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The axis' pin levels and sequence index after every tick, given which
+    ticks it steps on and which way it moves through STEP_SEQUENCE on each
+    """
+    deltas = np.where(steps, moves, 0)
+    after = (axis.sequence_index + np.cumsum(deltas)) % 8
+    before = (after - deltas) % 8
+
+    # Pins keep their levels until the next step
+    last_step = np.maximum.accumulate(np.where(steps, np.arange(len(steps)), -1))
+    levels = np.where(
+        last_step >= 0, SEQUENCE_MASKS[before[last_step]], axis.levels
+    ).astype(np.uint8)
+
+    return levels, after.astype(np.uint8)
+
+
+def stand_ins(plotter: Plotter) -> tuple[Axis, Axis]:
+    """
+    Axes in the same directions as the plotter's, so backlash is worked out
+    the same way the plotter does it without touching its state
+    """
+    x = Axis(None, plotter.x.pins, plotter.x.sequence_step)
+    y = Axis(None, plotter.y.pins, plotter.y.sequence_step)
+    x.direction, y.direction = plotter.x.direction, plotter.y.direction
+    return x, y
+
+
+def command_steps(
+    x: Axis, y: Axis, commands: Iterable[Command | Move], start_tick: int = 0
+) -> Iterator[tuple[tuple[int, int], Direction, Direction, np.ndarray, np.ndarray]]:
+    """
+    For each command, the (x, y) axis directions before it, the directions
+    it moves in and which of its ticks step x and which step y. x and y
+    follow along. Starting from start_tick skips the ticks of the first
+    command an interrupted run already did, like Plotter.command_ticks.
+    """
+    first = True
+    for command in commands:
+        before = (x.direction.value, y.direction.value)
+
+        if isinstance(command, Move):
+            x_dir, y_dir = Direction(sign(command.dx)), Direction(sign(command.dy))
+            x_step, y_step = vector_steps(
+                command.dx, command.dy, x.set_direction(x_dir), y.set_direction(y_dir)
+            )
+        else:
+            x_dir, y_dir = Direction(command.x), Direction(command.y)
+            x_step, y_step = motor_steps(
+                command.steps, x.set_direction(x_dir), y.set_direction(y_dir)
+            )
+
+        # Only the first command is ever part done
+        skip = start_tick if first else 0
+        first = False
+        yield (
+            before,
+            x_dir,
+            y_dir,
+            x_step[skip:] & (x_dir != Direction.ZERO),
+            y_step[skip:] & (y_dir != Direction.ZERO),
+        )
+
+
+def compile_commands(
+    plotter: Plotter, commands: Iterable[Command | Move], start_tick: int = 0
+) -> CompiledCommands:
+    """
+    Works out every tick of the commands ahead of time, starting from the
+    plotter's current state, which it leaves alone. Starting from start_tick
+    skips the ticks of the first command an interrupted run already did.
+    """
+    x, y = stand_ins(plotter)
+
+    x_steps, y_steps, x_moves, y_moves, periods = [], [], [], [], []
+    lengths, directions = [], []
+
+    for before, x_dir, y_dir, x_step, y_step in command_steps(
+        x, y, commands, start_tick
+    ):
+        directions.append(before)
+        x_steps.append(x_step)
+        y_steps.append(y_step)
+        x_moves.append(np.full(len(x_step), x_dir.value * x.sequence_step, np.int8))
+        y_moves.append(np.full(len(y_step), y_dir.value * y.sequence_step, np.int8))
+        periods.append(trapezoid_periods(len(x_step)))
+        lengths.append(len(x_step))
+
+    directions.append((x.direction.value, y.direction.value))
+
+    def joined(arrays, dtype):
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype)
+
+    x_levels, x_after = axis_levels(
+        plotter.x, joined(x_steps, bool), joined(x_moves, np.int8)
+    )
+    y_levels, y_after = axis_levels(
+        plotter.y, joined(y_steps, bool), joined(y_moves, np.int8)
+    )
+
+    ticks = np.zeros(len(x_levels), TICK_DTYPE)
+    ticks["levels"] = x_levels | y_levels << 4
+    ticks["changed"] = ticks["levels"] ^ np.concatenate(
+        ([plotter.x.levels | plotter.y.levels << 4], ticks["levels"][:-1])
+    ).astype(np.uint8)
+    ticks["sequence"] = x_after | y_after << 4
+    ticks["period"] = joined(periods, np.float64)
+
+    return CompiledCommands(
+        ticks=ticks,
+        starts=np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))),
+        directions=np.array(directions, np.int8).reshape(-1, 2),
+    )
+
+
+def command_totals(
+    plotter: Plotter, commands: Iterable[Command | Move], start_tick: int = 0
+) -> tuple[int, int, float]:
+    """
+    How many commands there are, how many ticks they take and how long those
+    are planned to last, starting from the plotter's current state like
+    compile_commands. Goes through them one at a time, so a file can be
+    streamed through without loading it.
+    """
+    x, y = stand_ins(plotter)
+    count = ticks = 0
+    secs = 0.0
+    planned_secs: dict[int, float] = {}
+
+    for _, _, _, x_step, _ in command_steps(x, y, commands, start_tick):
+        length = len(x_step)
+        if length not in planned_secs:
+            planned_secs[length] = float(trapezoid_periods(length).sum())
+        count += 1
+        ticks += length
+        secs += planned_secs[length]
+
+    return count, ticks, secs
+
+
+def command_ticks(
+    plotter: Plotter, compiled: CompiledCommands, index: int
+) -> Iterator[float]:
+    """
+    Runs command index of compiled on the plotter, writing only the pins that
+    change each tick. The plotter's state follows along, so it can be
+    checkpointed or carry on with uncompiled moves afterwards.
+    """
+    pins = plotter.x.pins + plotter.y.pins
+    output = plotter.gpio.output
+    x_dir, y_dir = compiled.directions[index + 1].tolist()
+    plotter.x.direction = Direction(x_dir)
+    plotter.y.direction = Direction(y_dir)
+
+    ticks = compiled.ticks[compiled.starts[index] : compiled.starts[index + 1]]
+    for levels, changed, sequence, period in ticks.tolist():
+        for bit in CHANGED_BITS[changed]:
+            output(pins[bit], levels >> bit & 1)
+        plotter.x.sequence_index = sequence & 7
+        plotter.y.sequence_index = sequence >> 4
+        plotter.x.levels = levels & 15
+        plotter.y.levels = levels >> 4
+        yield period
+
+
+def main():
+    if len(argv) != 2:
+        print("Nuh uh! Supply a single argument please")
+        return
+
+    # Times each tick of the plotter's own loop against the compiled one,
+    # without any waiting, on fake GPIO
+    from fleet import FLEET_PINS
+    from gpio_backend import FakeGPIO
+    from toolfile import load_commands
+
+    commands = load_commands(argv[1])
+    gpio = FakeGPIO()
+
+    plotter = Plotter(gpio, *FLEET_PINS[0])
+    start_time = time.perf_counter()
+    ticks = sum(1 for com in commands for _ in plotter.command_ticks(com))
+    loop_secs = time.perf_counter() - start_time
+    loop_writes = gpio.writes
+
+    plotter = Plotter(gpio, *FLEET_PINS[0])
+    gpio.writes = 0
+    start_time = time.perf_counter()
+    compiled = compile_commands(plotter, commands)
+    compile_secs = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for index in range(len(commands)):
+        for _ in command_ticks(plotter, compiled, index):
+            pass
+    compiled_secs = time.perf_counter() - start_time
+
+    print(
+        f"{ticks} ticks, compiled in {compile_secs:.2f} s "
+        f"to {compiled.ticks.nbytes / 1024 / 1024:.1f} MiB"
+    )
+    print(
+        f"Plotter loop: {loop_secs / ticks * 1e6:.2f} us, "
+        f"{loop_writes / ticks:.2f} writes per tick"
+    )
+    print(
+        f"Compiled: {compiled_secs / ticks * 1e6:.2f} us, "
+        f"{gpio.writes / ticks:.2f} writes per tick"
+    )
+
+
+if __name__ == "__main__":
+    main()
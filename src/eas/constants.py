@@ -12,3 +12,13 @@ DIRECTIONS = [
     (0, -1),  # Left
     (-1, -1),  # Up-Left
 ]
+
+STEPS_PER_PIXEL = 100  # motor steps written per pixel of toolpath
+STEP_SLEEP_SECS = 0.002  # careful lowering this, at some point you run into the mechanical limitation of how quick your motor can move
+BACKLASH_COMPENSATION_STEPS = 200  # Number of steps needed to compensate for backlash
+MIN_STEP_SLEEP_SECS = (
+    0.0012  # cruise speed on long moves, moves start and end at STEP_SLEEP_SECS
+)
+ACCEL_TICKS = 256  # ticks to ramp between STEP_SLEEP_SECS and MIN_STEP_SLEEP_SECS
+CANNY_LOW_THRESHOLD = 100
+CANNY_HIGH_THRESHOLD = 200
@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+from command import Command, Move, direction, length
+from constants import BACKLASH_COMPENSATION_STEPS, STEP_SLEEP_SECS, STEPS_PER_PIXEL
+
+
+@dataclass
+class CostModel:
+    """
+    Cost of moving the pen, in pixels of travel. A move that reverses an axis
+    costs the backlash compensation spin_motor adds for it (both axes take it
+    up at the same time), and every pixel of new line drawn just to get
+    somewhere (which can't be erased) costs stray_cost pixels of retracing an
+    existing one.
+    """
+
+    reversal_cost: float = BACKLASH_COMPENSATION_STEPS / STEPS_PER_PIXEL
+    stray_cost: float = 4
+
+
+def axis_reversals(
+    state: tuple[int, int], x: int, y: int
+) -> tuple[int, tuple[int, int]]:
+    """
+    Counts the axes a move reverses, given the last direction each axis moved
+    in (0 if it hasn't yet). Returns the count and the directions after the move.
+    """
+    state_x, state_y = state
+    count = 0
+    if state_x != 0 and x != 0 and state_x != x:
+        count += 1
+    if state_y != 0 and y != 0 and state_y != y:
+        count += 1
+
+    return count, (x if x != 0 else state_x, y if y != 0 else state_y)
+
+
+def reversals(commands: list[Command | Move], state: tuple[int, int] = (0, 0)) -> int:
+    """
+    Number of axis reversals, each of which costs BACKLASH_COMPENSATION_STEPS
+    """
+    total = 0
+    for command in commands:
+        count, state = axis_reversals(state, *direction(command))
+        total += count
+
+    return total
+
+
+def command_state(
+    commands: list[Command | Move], state: tuple[int, int] = (0, 0)
+) -> tuple[int, int]:
+    """
+    Axis directions after running the commands
+    """
+    for command in commands:
+        state = axis_reversals(state, *direction(command))[1]
+
+    return state
+
+
+def travel(commands: list[Command | Move]) -> int:
+    """
+    Total distance the pen moves, in the commands' own units
+    """
+    return sum(length(command) for command in commands)
+
+
+def draw_ticks(commands: list[Command | Move], scale: int = 1) -> int:
+    """
+    Number of motor ticks main.spin_motor / spin_vector take to run the
+    commands, backlash compensation included. scale converts command steps to
+    motor steps, use STEPS_PER_PIXEL for planner output.
+    """
+    ticks = 0
+    state = (0, 0)
+
+    for command in commands:
+        prev_x, prev_y = state
+        _, state = axis_reversals(state, *direction(command))
+
+        # An axis whose direction changed has to take up the backlash first
+        x_backlash = y_backlash = 0
+        if prev_x != 0 and prev_x != state[0]:
+            x_backlash = BACKLASH_COMPENSATION_STEPS
+        if prev_y != 0 and prev_y != state[1]:
+            y_backlash = BACKLASH_COMPENSATION_STEPS
+
+        # Both drivers take up backlash on the two axes at the same time
+        ticks += length(command) * scale + max(x_backlash, y_backlash)
+
+    return ticks
+
+
+def draw_time_secs(
+    commands: list[Command | Move], scale: int = STEPS_PER_PIXEL
+) -> float:
+    """
+    Physical draw time of planner output at STEP_SLEEP_SECS per tick
+    """
+    return draw_ticks(commands, scale) * STEP_SLEEP_SECS
@@ -0,0 +1,293 @@
+import heapq
+import numpy as np
+from constants import DIRECTIONS
+from cost import CostModel, axis_reversals
+
+CELL_SIZE = 16
+
+
+class DrawnIndex:
+    """
+    Keeps track of the drawn (1) pixels of an image as they're drawn.
+
+    Union-find joins neighbouring drawn pixels into the lines the pen can
+    travel along, and every line keeps its pixels bucketed into square cells,
+    so finding the drawn pixel closest to a target that the pen can reach
+    only looks at that line's cells near the target. Lines merge smaller into
+    larger, so adding a pixel is cheap however much has been drawn.
+    """
+
+    def __init__(self, img: np.ndarray, cell_size: int = CELL_SIZE):
+        self.height, self.width = img.shape
+        self.cell_size = cell_size
+
+        pixels = self.height * self.width
+        self.parent = [-1] * pixels  # -1 for pixels that aren't drawn
+        self.size = [0] * pixels
+        # root -> (cell y, cell x) -> pixel ids in that cell
+        self.cells: dict[int, dict[tuple[int, int], list[int]]] = {}
+        # pixels the last route or cheapest_route reached, for profiling
+        self.searched = 0
+
+        for y, x in zip(*np.nonzero(img == 1)):
+            self.add((int(y), int(x)))
+
+    def is_drawn(self, point: tuple[int, int]) -> bool:
+        y, x = point
+        return (
+            0 <= y < self.height
+            and 0 <= x < self.width
+            and self.parent[y * self.width + x] != -1
+        )
+
+    def find(self, pixel: int) -> int:
+        parent = self.parent
+        while parent[pixel] != pixel:
+            parent[pixel] = parent[parent[pixel]]
+            pixel = parent[pixel]
+        return pixel
+
+    def add(self, point: tuple[int, int]):
+        """
+        Records a pixel as drawn, joining it to the lines it touches
+        """
+        if self.is_drawn(point):
+            return
+
+        y, x = point
+        pixel = y * self.width + x
+        self.parent[pixel] = pixel
+        self.size[pixel] = 1
+        self.cells[pixel] = {(y // self.cell_size, x // self.cell_size): [pixel]}
+
+        for dy, dx in DIRECTIONS:
+            neighbour = (y + dy, x + dx)
+            if self.is_drawn(neighbour):
+                self.union(pixel, neighbour[0] * self.width + neighbour[1])
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        cells = self.cells[a]
+        for cell, pixels in self.cells.pop(b).items():
+            cells.setdefault(cell, []).extend(pixels)
+
+    def closest(
+        self, origin: tuple[int, int], target: tuple[int, int]
+    ) -> tuple[int, int]:
+        """
+        Drawn pixel the pen can reach from origin along drawn lines that's
+        closest to target (euclidean, ties go to origin)
+        """
+        if not self.is_drawn(origin):
+            return origin
+
+        target_y, target_x = target
+        cells = self.line_cells(origin)
+        best_score = (origin[0] - target_y) ** 2 + (origin[1] - target_x) ** 2
+
+        def score(ys, xs):
+            return (ys - target_y) ** 2 + (xs - target_x) ** 2
+
+        point, _ = self.search_cells(
+            cells, target, score, lambda dist: dist * dist, best_score
+        )
+        return origin if point is None else point
+
+    def cheapest_route(
+        self,
+        origin: tuple[int, int],
+        target: tuple[int, int],
+        state: tuple[int, int],
+        cost_model: CostModel,
+    ) -> list[tuple[int, int]]:
+        """
+        Path along drawn pixels from origin to the one with the cheapest route
+        on to target: retraced steps and reversals on the way, plus the new
+        line weighted by stray_cost. state is the axis directions the pen
+        last moved in.
+
+        Breadth first like a plain search, but it stops once the steps alone
+        cost more than the best so far, counting the stray line from the
+        line's pixel nearest target (found with the cells).
+        """
+        if not self.is_drawn(origin):
+            self.searched = 0
+            return [origin]
+
+        target_y, target_x = target
+        cells = self.line_cells(origin)
+
+        def chebyshev(ys, xs):
+            return np.maximum(np.abs(ys - target_y), np.abs(xs - target_x))
+
+        nearest = max(abs(origin[0] - target_y), abs(origin[1] - target_x))
+        _, nearest = self.search_cells(
+            cells, target, chebyshev, lambda dist: dist, nearest
+        )
+        least_stray = nearest * cost_model.stray_cost
+
+        parents = {origin: None}
+        level = [(origin, state, 0)]
+        best, best_cost = origin, None
+        steps = 0
+
+        while level and (best_cost is None or steps + least_stray < best_cost):
+            next_level = []
+            for point, route_state, route_reversals in level:
+                y, x = point
+                dy, dx = target_y - y, target_x - x
+                line_reversals, _ = axis_reversals(
+                    route_state, int(np.sign(dx)), int(np.sign(dy))
+                )
+                cost = (
+                    steps
+                    + (route_reversals + (line_reversals > 0))
+                    * cost_model.reversal_cost
+                    + max(abs(dy), abs(dx)) * cost_model.stray_cost
+                )
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = point, cost
+
+                for step_y, step_x in DIRECTIONS:
+                    neighbour = (y + step_y, x + step_x)
+                    if neighbour in parents or not self.is_drawn(neighbour):
+                        continue
+
+                    parents[neighbour] = point
+                    reversed_axes, neighbour_state = axis_reversals(
+                        route_state, step_x, step_y
+                    )
+                    next_level.append(
+                        (
+                            neighbour,
+                            neighbour_state,
+                            route_reversals + (reversed_axes > 0),
+                        )
+                    )
+
+            level = next_level
+            steps += 1
+
+        self.searched = len(parents)
+        path = []
+        point = best
+        while point is not None:
+            path.append(point)
+            point = parents[point]
+        path.reverse()
+
+        return path
+
+    def line_cells(self, point: tuple[int, int]) -> dict:
+        return self.cells[self.find(point[0] * self.width + point[1])]
+
+    def search_cells(self, cells: dict, target: tuple[int, int], score, bound, best):
+        """
+        Looks through cells in rings around target's for the pixel with the
+        lowest score under best. bound(dist) is the lowest score a pixel dist
+        away from target can have. Returns the pixel, None if there wasn't
+        one, and its score.
+        """
+        point = None
+        grid_height = -(-self.height // self.cell_size)
+        grid_width = -(-self.width // self.cell_size)
+        cell_y = target[0] // self.cell_size
+        cell_x = target[1] // self.cell_size
+
+        for radius in range(max(grid_height, grid_width)):
+            # Every pixel in this ring is at least this far from target
+            if radius > 0 and bound((radius - 1) * self.cell_size + 1) >= best:
+                break
+
+            for cell in ring(cell_y, cell_x, radius):
+                pixels = cells.get(cell)
+                if pixels is None:
+                    continue
+
+                ys, xs = np.divmod(np.array(pixels), self.width)
+                scores = score(ys, xs)
+                i = int(np.argmin(scores))
+                if scores[i] < best:
+                    point, best = (int(ys[i]), int(xs[i])), int(scores[i])
+
+        return point, best
+
+    def route(
+        self, start: tuple[int, int], goal: tuple[int, int]
+    ) -> list[tuple[int, int]]:
+        """
+        Shortest path along drawn pixels from start to goal, both included.
+        A* with chebyshev distance, so it only looks around the way there.
+        Carries on in the same direction when it can.
+        """
+        if start == goal:
+            self.searched = 1
+            return [start]
+
+        def estimate(point):
+            return max(abs(goal[0] - point[0]), abs(goal[1] - point[1]))
+
+        parents = {start: None}
+        steps = {start: 0}
+        heading = {start: None}
+        queue = [(estimate(start), 0, start)]
+        order = 0
+
+        while queue:
+            _, _, point = heapq.heappop(queue)
+            if point == goal:
+                break
+
+            y, x = point
+            directions = DIRECTIONS
+            if heading[point] is not None:
+                directions = [heading[point]] + DIRECTIONS
+
+            for dy, dx in directions:
+                neighbour = (y + dy, x + dx)
+                if not self.is_drawn(neighbour):
+                    continue
+
+                neighbour_steps = steps[point] + 1
+                if neighbour_steps < steps.get(neighbour, neighbour_steps + 1):
+                    steps[neighbour] = neighbour_steps
+                    parents[neighbour] = point
+                    heading[neighbour] = (dy, dx)
+                    order += 1
+                    heapq.heappush(
+                        queue,
+                        (neighbour_steps + estimate(neighbour), order, neighbour),
+                    )
+
+        self.searched = len(parents)
+        path = []
+        point = goal
+        while point is not None:
+            path.append(point)
+            point = parents[point]
+        path.reverse()
+
+        return path
+
+
+def ring(cell_y: int, cell_x: int, radius: int):
+    """
+    Yields the cells on the square ring around a cell, off grid ones included
+    """
+    if radius == 0:
+        yield cell_y, cell_x
+        return
+
+    for x in range(cell_x - radius, cell_x + radius + 1):
+        yield cell_y - radius, x
+        yield cell_y + radius, x
+    for y in range(cell_y - radius + 1, cell_y + radius):
+        yield y, cell_x - radius
+        yield y, cell_x + radius
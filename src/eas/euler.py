@@ -0,0 +1,259 @@
+import cv2 as cv
+import numpy as np
+from collections import deque
+from itertools import pairwise
+from sys import argv
+from command import Command, save_commands
+import chains
+import cost
+from cost import CostModel, axis_reversals
+
+PLANNER_VERSION = 1
+
+
+def pixel_graph(img: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Builds a graph over the edge pixels (255) of an image, returns the pixel
+    coordinates of every node and the node pairs of every edge.
+
+    Neighbours are joined horizontally and vertically, diagonals only when no
+    corner pixel already links the two, so a staircase doesn't turn into a
+    string of triangles full of odd junctions.
+    """
+    edges = img == 255
+    height, width = edges.shape
+
+    ids = np.full((height, width), -1)
+    ys, xs = np.nonzero(edges)
+    ids[ys, xs] = np.arange(len(ys))
+
+    padded = np.pad(edges, 1)
+
+    def shifted(dy: int, dx: int) -> np.ndarray:
+        return padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+
+    pairs = []
+    for dy, dx in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        mask = edges & shifted(dy, dx)
+        if dy != 0 and dx != 0:
+            mask &= ~shifted(dy, 0) & ~shifted(0, dx)
+
+        from_y, from_x = np.nonzero(mask)
+        pairs.append(
+            np.stack((ids[from_y, from_x], ids[from_y + dy, from_x + dx]), axis=1)
+        )
+
+    return np.stack((ys, xs), axis=1), np.concatenate(pairs)
+
+
+def pair_odd_nodes(
+    adjacency: list[list[tuple[int, int]]], odd: set[int]
+) -> list[list[int]]:
+    """
+    Greedily pairs up odd nodes along short paths, closest pairs first.
+
+    Grows BFS regions from every unmatched node at once, every place two regions
+    touch is a candidate path between their owners. Candidates are taken in
+    order of length, and nodes left over are paired again in another round.
+    """
+    paths = []
+    unmatched = set(odd)
+
+    while len(unmatched) >= 2:
+        owner = {node: node for node in unmatched}
+        parent = {node: None for node in unmatched}
+        depth = {node: 0 for node in unmatched}
+        queue = deque(sorted(unmatched))
+        candidates = []
+
+        while queue:
+            node = queue.popleft()
+            for neighbour, _ in adjacency[node]:
+                if neighbour not in owner:
+                    owner[neighbour] = owner[node]
+                    parent[neighbour] = node
+                    depth[neighbour] = depth[node] + 1
+                    queue.append(neighbour)
+                elif owner[neighbour] != owner[node]:
+                    candidates.append(
+                        (depth[node] + depth[neighbour] + 1, node, neighbour)
+                    )
+
+        candidates.sort()
+        for _, a, b in candidates:
+            if owner[a] not in unmatched or owner[b] not in unmatched:
+                continue
+
+            path = []
+            while a is not None:
+                path.append(a)
+                a = parent[a]
+            path.reverse()
+            while b is not None:
+                path.append(b)
+                b = parent[b]
+
+            paths.append(path)
+            unmatched.discard(path[0])
+            unmatched.discard(path[-1])
+
+        if not candidates:
+            break
+
+    return paths
+
+
+def euler_trail(
+    adjacency: list[list[tuple[int, int]]],
+    start: int,
+    edge_count: int,
+    nodes: np.ndarray | None = None,
+) -> list[int]:
+    """
+    Hierholzer's algorithm, walks every edge exactly once starting from start.
+    Given the node coordinates, it carries on straight where it can and
+    otherwise avoids reversing an axis.
+    """
+    used = [False] * edge_count
+    pointer = [0] * len(adjacency)
+    stack = [start]
+    states = [((0, 0), (0, 0))]  # direction of the last hop, axis directions
+    trail = []
+
+    while stack:
+        node = stack[-1]
+        edges = adjacency[node]
+        while pointer[node] < len(edges) and used[edges[pointer[node]][1]]:
+            pointer[node] += 1
+
+        if pointer[node] == len(edges):
+            trail.append(stack.pop())
+            states.pop()
+            continue
+
+        choice = pointer[node]
+        if nodes is not None:
+            last_hop, state = states[-1]
+            best_rank = None
+            for k in range(pointer[node], len(edges)):
+                neighbour, edge = edges[k]
+                if used[edge]:
+                    continue
+                dy, dx = (nodes[neighbour] - nodes[node]).tolist()
+                rank = (
+                    0 if (dy, dx) == last_hop else 1 + axis_reversals(state, dx, dy)[0]
+                )
+                if best_rank is None or rank < best_rank:
+                    best_rank, choice = rank, k
+
+        neighbour, edge = edges[choice]
+        used[edge] = True
+        stack.append(neighbour)
+        if nodes is not None:
+            dy, dx = (nodes[neighbour] - nodes[node]).tolist()
+            states.append(((dy, dx), axis_reversals(states[-1][1], dx, dy)[1]))
+        else:
+            states.append(states[-1])
+
+    return trail[::-1]
+
+
+def component_trails(
+    img: np.ndarray, cost_model: CostModel | None = None
+) -> tuple[list[list[tuple[int, int]]], int]:
+    """
+    Returns one trail per connected component that covers every edge of its
+    pixel graph, and the number of pixel hops that had to be retraced.
+
+    Odd junctions are paired along short paths and those paths are doubled,
+    leaving the longest pair unmatched so the trail can start and end on it.
+    Retracing is therefore exactly the total length of the doubled paths.
+    With a cost model the walk steers away from reversing an axis.
+    """
+    nodes, pairs = pixel_graph(img)
+    if len(nodes) == 0:
+        return [], 0
+
+    adjacency: list[list[tuple[int, int]]] = [[] for _ in range(len(nodes))]
+    for edge, (a, b) in enumerate(pairs.tolist()):
+        adjacency[a].append((b, edge))
+        adjacency[b].append((a, edge))
+    edge_count = len(pairs)
+
+    _, labels = cv.connectedComponents((img == 255).astype(np.uint8), connectivity=8)
+    node_labels = labels[nodes[:, 0], nodes[:, 1]]
+
+    trails = []
+    retraced = 0
+    for label in np.unique(node_labels):
+        component = np.flatnonzero(node_labels == label).tolist()
+        odd = {node for node in component if len(adjacency[node]) % 2 == 1}
+
+        # The longest pairing is left out, the trail starts and ends on it
+        paths = sorted(pair_odd_nodes(adjacency, odd), key=len)
+        if paths:
+            open_ends = paths.pop()
+            odd = {open_ends[0], open_ends[-1]}
+
+        for path in paths:
+            for a, b in pairwise(path):
+                adjacency[a].append((b, edge_count))
+                adjacency[b].append((a, edge_count))
+                edge_count += 1
+            retraced += len(path) - 1
+
+        start = min(odd) if odd else component[0]
+        trail = euler_trail(
+            adjacency, start, edge_count, nodes if cost_model is not None else None
+        )
+        trails.append([tuple(nodes[node].tolist()) for node in trail])
+
+    return trails, retraced
+
+
+def generate_toolpath(
+    img: np.ndarray, cost_model: CostModel | None = None
+) -> list[Command]:
+    trails, _ = component_trails(img, cost_model)
+    return chains.chains_to_commands(chains.order_chains(trails, cost_model=cost_model))
+
+
+def main():
+    if len(argv) not in (2, 3):
+        print("Nuh uh! Supply an image and optionally an output file please")
+        return
+
+    import image
+    import toolpath
+
+    edges = image.canny(argv[1])
+    trails, retraced = component_trails(edges, CostModel())
+    coms = chains.chains_to_commands(
+        chains.order_chains(trails, cost_model=CostModel())
+    )
+    plain_coms = generate_toolpath(edges)
+    greedy_coms = toolpath.generate_toolpath(edges.copy())
+
+    euler_secs = cost.draw_time_secs(coms)
+    greedy_secs = cost.draw_time_secs(greedy_coms)
+
+    print(f"Components: {len(trails)}, retraced: {retraced} px")
+    print(
+        f"Euler planner: {len(coms)} commands, {cost.travel(coms)} px travel, "
+        f"{euler_secs / 60:.1f} min"
+    )
+    print(
+        f"Greedy planner: {len(greedy_coms)} commands, "
+        f"{cost.travel(greedy_coms)} px travel, {greedy_secs / 60:.1f} min"
+    )
+    print(
+        f"Reversals: {cost.reversals(coms)}, "
+        f"{cost.reversals(plain_coms) - cost.reversals(coms)} avoided by the cost model"
+    )
+
+    if len(argv) == 3:
+        save_commands(argv[2], coms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass
+from sys import argv
+from plotter import Plotter
+from scheduler import MonotonicClock, StepScheduler
+from toolfile import iter_commands
+
+# x and y pins of each Etch-a-Sketch on the Pi, the first is main's
+FLEET_PINS = [
+    ([17, 18, 27, 22], [5, 6, 12, 13]),
+    ([23, 24, 25, 8], [16, 19, 20, 26]),
+]
+
+
+@dataclass
+class FleetJob:
+    """
+    A command file to draw on whichever plotter is free. Goes queued ->
+    drawing -> done, or failed.
+    """
+
+    id: int
+    path: str
+    status: str = "queued"
+    device: str | None = None
+    ticks_done: int = 0
+    started: float | None = None
+    finished: float | None = None
+    error: str | None = None
+
+
+def job_ticks(plotter: Plotter, path: str) -> Iterator[float]:
+    """
+    Homes the pen, then draws the file
+    """
+    yield from plotter.home()
+    for command in iter_commands(path):
+        yield from plotter.command_ticks(command)
+
+
+class Station:
+    """
+    A plotter in the fleet, with its own scheduler (so its own deadlines and
+    timing stats) and the job it's drawing, if any
+    """
+
+    def __init__(self, plotter: Plotter, clock):
+        self.plotter = plotter
+        self.scheduler = StepScheduler(clock)
+        self.job: FleetJob | None = None
+        self.ticks: Iterator[float] | None = None
+
+    @property
+    def deadline(self) -> float:
+        return self.scheduler.deadline
+
+    def start(self, job: FleetJob):
+        self.job = job
+        self.ticks = job_ticks(self.plotter, job.path)
+        job.status = "drawing"
+        job.device = self.plotter.name
+        job.started = time.time()
+        self.tick()
+
+    def tick(self):
+        """
+        Steps the motors for the next tick of the job and schedules the one
+        after, or finishes the job
+        """
+        try:
+            period = next(self.ticks)
+        except StopIteration:
+            self.finish("done")
+            return
+        except Exception as error:
+            # A bad file or GPIO error fails this job, the other plotters
+            # carry on
+            logging.exception("Job %s failed on %s", self.job.path, self.plotter.name)
+            self.job.error = str(error)
+            self.finish("failed")
+            return
+
+        self.job.ticks_done += 1
+        self.scheduler.schedule(period)
+
+    def finish(self, status: str):
+        self.job.status = status
+        self.job.finished = time.time()
+        self.job = None
+        self.ticks = None
+
+
+class Fleet:
+    """
+    Draws jobs on several plotters from one timing loop, no thread or
+    process per plotter. The loop sleeps until the earliest deadline of any
+    busy plotter, steps it and schedules its next tick, so each one keeps its
+    own ramps. Queued jobs go to plotters as they come free, first in first
+    out.
+    """
+
+    def __init__(self, plotters: list[Plotter], clock=None):
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.stations = [Station(plotter, self.clock) for plotter in plotters]
+        self.queue: deque[FleetJob] = deque()
+        self.jobs: list[FleetJob] = []
+        self.ids = itertools.count(1)
+
+    def submit(self, path: str) -> FleetJob:
+        job = FleetJob(id=next(self.ids), path=path)
+        self.jobs.append(job)
+        self.queue.append(job)
+        return job
+
+    def assign(self):
+        """
+        Starts queued jobs on free plotters
+        """
+        for station in self.stations:
+            while station.job is None and self.queue:
+                station.start(self.queue.popleft())
+
+    def run(self):
+        """
+        Draws until every queued job is done
+        """
+        self.assign()
+        while True:
+            busy = [station for station in self.stations if station.job is not None]
+            if not busy:
+                return
+
+            station = min(busy, key=lambda station: station.deadline)
+            self.clock.sleep_until(station.deadline)
+            station.scheduler.settle()
+            station.tick()
+
+            if station.job is None:
+                self.assign()
+
+    def stats(self) -> dict:
+        return {
+            station.plotter.name: station.scheduler.stats() for station in self.stations
+        }
+
+
+def main():
+    args = argv[1:]
+    if "--fake" in args:
+        # Draws on the fake GPIO backend, in real time, for running off a Pi
+        os.environ["EAS_GPIO"] = "fake"
+        args.remove("--fake")
+    if not args:
+        print("Nuh uh! Supply some command files (and optionally --fake) please")
+        return
+
+    from gpio_backend import load_gpio
+
+    gpio = load_gpio()
+    plotters = [
+        Plotter(gpio, x_pins, y_pins, name=str(i))
+        for i, (x_pins, y_pins) in enumerate(FLEET_PINS)
+    ]
+    fleet = Fleet(plotters)
+    for path in args:
+        fleet.submit(path)
+
+    gpio.setmode(gpio.BCM)
+    for plotter in plotters:
+        plotter.setup()
+
+    print(f"Drawing {len(args)} jobs on {len(plotters)} plotters...")
+    try:
+        fleet.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for plotter in plotters:
+            plotter.release()
+        gpio.cleanup()
+
+    for job in fleet.jobs:
+        print(f"{job.path}: {job.status} on plotter {job.device}")
+    for name, stats in fleet.stats().items():
+        if stats["ticks"]:
+            print(
+                f"Plotter {name}: {stats['ticks']} ticks, "
+                f"max lateness {stats['max_lateness_secs'] * 1e6:.0f} us"
+            )
+
+
+if __name__ == "__main__":
+    main()
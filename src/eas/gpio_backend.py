@@ -0,0 +1,136 @@
+import numpy as np
+import os
+import warnings
+from array import array
+from typing import Protocol
+from scheduler import MonotonicClock
+
+BACKENDS = ["rpi", "fake", "record"]
+
+TRACE_FILE = "gpio_trace.npy"  # where the record backend saves its trace
+TRACE_DTYPE = np.dtype([("time", "<f8"), ("pin", "u1"), ("level", "u1")])
+
+
+class GPIOBackend(Protocol):
+    """
+    The parts of RPi.GPIO the driver uses, which every backend provides
+    """
+
+    BCM: object
+    OUT: object
+    LOW: int
+    HIGH: int
+
+    def setmode(self, mode): ...
+
+    def setup(self, pin: int, direction): ...
+
+    def output(self, pin: int, value: int): ...
+
+    def cleanup(self): ...
+
+
+class FakeGPIO:
+    """
+    Stands in for RPi.GPIO off a Pi. Keeps the current level of every pin and
+    counts writes. Given a clock, every write takes output_secs on it, which
+    is how long a GPIO call costs on the real thing.
+    """
+
+    BCM = "BCM"
+    OUT = "OUT"
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, clock=None, output_secs: float = 0.0):
+        self.clock = clock
+        self.output_secs = output_secs
+        self.mode = None
+        self.levels: dict[int, int] = {}
+        self.writes = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin: int, direction):
+        self.levels[pin] = self.LOW
+
+    def output(self, pin: int, value: int):
+        self.levels[pin] = int(value)
+        self.writes += 1
+        if self.output_secs:
+            self.clock.advance(self.output_secs)
+
+    def cleanup(self):
+        self.levels.clear()
+
+
+class RecordingGPIO(FakeGPIO):
+    """
+    FakeGPIO that logs every write with the time it was made on clock, a
+    FakeClock for virtual time or a MonotonicClock for real time. Saves the
+    trace (see TRACE_DTYPE) to path on cleanup, when given one.
+    """
+
+    def __init__(self, clock, output_secs: float = 0.0, path: str | None = None):
+        super().__init__(clock, output_secs)
+        self.path = path
+        self.times = array("d")
+        self.pins = array("B")
+        self.values = array("B")
+
+    def output(self, pin: int, value: int):
+        self.times.append(self.clock.now())
+        self.pins.append(pin)
+        self.values.append(int(value))
+        super().output(pin, value)
+
+    def trace(self) -> np.ndarray:
+        trace = np.zeros(len(self.times), TRACE_DTYPE)
+        trace["time"] = self.times
+        trace["pin"] = self.pins
+        trace["level"] = self.values
+        return trace
+
+    def save(self, path: str):
+        np.save(path, self.trace())
+
+    def cleanup(self):
+        if self.path is not None:
+            self.save(self.path)
+        super().cleanup()
+
+
+def load_gpio(name: str | None = None) -> GPIOBackend:
+    """
+    Returns the GPIO module to drive the motors with, picked by name or the
+    EAS_GPIO environment variable, defaulting to RPi.GPIO. record times
+    writes on the real clock and saves them to EAS_GPIO_TRACE. Off a Pi,
+    with neither given, it falls back to fake with a warning.
+    """
+    if name is None and "EAS_GPIO" not in os.environ:
+        try:
+            import RPi.GPIO as GPIO
+        except ImportError:
+            warnings.warn(
+                "RPi.GPIO isn't installed, the motors won't move. "
+                "Set EAS_GPIO=fake to use fake GPIO without this warning.",
+                stacklevel=2,
+            )
+            return FakeGPIO()
+        return GPIO
+
+    name = name or os.environ["EAS_GPIO"]
+    match name:
+        case "rpi":
+            import RPi.GPIO as GPIO
+
+            return GPIO
+        case "fake":
+            return FakeGPIO()
+        case "record":
+            return RecordingGPIO(
+                MonotonicClock(), path=os.environ.get("EAS_GPIO_TRACE", TRACE_FILE)
+            )
+
+    raise ValueError(f"Unknown GPIO backend {name}, expected one of {BACKENDS}")
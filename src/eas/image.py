@@ -1,27 +1,137 @@
 import numpy as np
 import cv2 as cv
-from pathlib import Path
+import os
+from dataclasses import asdict, dataclass
+from sys import argv
 from constants import *
+from thinning import SPUR_LENGTH, thin
 
-current_file_path = Path(__file__).resolve()
 
+def screen_resolution(width: int = RESOLUTION_HORIZONTAL) -> tuple[int, int]:
+    """
+    (width, height) in pixels of a box the shape of the Etch-a-Sketch screen
+    """
+    return width, round(width * SCREEN_HEIGHT_MM / SCREEN_WIDTH_MM)
 
-def resize_img(img: np.ndarray) -> np.ndarray:
-    return cv.resize(img, (RESOLUTION_HORIZONTAL, RESOLUTION_VERTICAL))
 
+@dataclass
+class Preprocessor:
+    """
+    Turns an image (a path, encoded bytes or an array) into the edge map the
+    planners draw. In order:
+    1. Fit: scales it to fit inside resolution, (width, height), keeping its
+       aspect ratio unless keep_aspect is off.
+    2. Blur: gaussian, blur_kernel pixels across (odd), skipped for 0.
+    3. Threshold: to black and white at threshold, skipped for None.
+    4. Canny, between canny_low and canny_high.
+    5. Thin: with thin on, edges are thinned to one pixel wide and branches
+       of up to spur_length pixels are pruned (see thinning.thin).
+    With a debug_dir, every stage is written there as a PNG.
+    """
 
-def canny(img_path: str) -> np.ndarray:
-    full_img_path = current_file_path / img_path
+    resolution: tuple[int, int] = (RESOLUTION_HORIZONTAL, RESOLUTION_VERTICAL)
+    keep_aspect: bool = True
+    blur_kernel: int = 0
+    threshold: int | None = None
+    canny_low: int = CANNY_LOW_THRESHOLD
+    canny_high: int = CANNY_HIGH_THRESHOLD
+    thin: bool = False
+    spur_length: int = SPUR_LENGTH
+    debug_dir: str | None = None
 
-    img = cv.imread(img_path, cv.IMREAD_GRAYSCALE)
-    assert img is not None, "file could not be read, check with os.path.exists()"
-    img = resize_img(img)
-    edges = cv.Canny(img, 100, 200)
-    ret, img = cv.threshold(img, 127, 255, cv.THRESH_BINARY_INV)
-    cv.imwrite("images/canny.jpg", img)
+    def params(self) -> dict:
+        """
+        Everything that changes the edges, for cache keys
+        """
+        params = asdict(self)
+        del params["debug_dir"]
+        params["resolution"] = list(self.resolution)
+        return params
 
-    return edges
+    @classmethod
+    def from_params(cls, params: dict) -> "Preprocessor":
+        return cls(**{**params, "resolution": tuple(params["resolution"])})
+
+    def load(self, source: str | bytes | np.ndarray) -> np.ndarray:
+        """
+        The source as a grayscale array
+        """
+        if isinstance(source, np.ndarray):
+            if source.ndim == 3:
+                return cv.cvtColor(source, cv.COLOR_BGR2GRAY)
+            return source
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            img = cv.imdecode(np.frombuffer(source, np.uint8), cv.IMREAD_GRAYSCALE)
+        else:
+            img = cv.imread(source, cv.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError("could not decode image")
+
+        return img
+
+    def fit(self, img: np.ndarray) -> np.ndarray:
+        width, height = self.resolution
+        if self.keep_aspect:
+            scale = min(width / img.shape[1], height / img.shape[0])
+            width = max(round(img.shape[1] * scale), 1)
+            height = max(round(img.shape[0] * scale), 1)
+
+        return cv.resize(img, (width, height))
+
+    def edges(self, source: str | bytes | np.ndarray) -> np.ndarray:
+        img = self.fit(self.load(source))
+        self.debug("fit", img)
+
+        if self.blur_kernel:
+            img = cv.GaussianBlur(img, (self.blur_kernel, self.blur_kernel), 0)
+            self.debug("blur", img)
+
+        if self.threshold is not None:
+            _, img = cv.threshold(img, self.threshold, 255, cv.THRESH_BINARY)
+            self.debug("threshold", img)
+
+        edges = cv.Canny(img, self.canny_low, self.canny_high)
+        self.debug("edges", edges)
+
+        if self.thin:
+            edges = thin(edges, self.spur_length)
+            self.debug("thin", edges)
+
+        return edges
+
+    def debug(self, stage: str, img: np.ndarray):
+        if self.debug_dir is not None:
+            os.makedirs(self.debug_dir, exist_ok=True)
+            cv.imwrite(os.path.join(self.debug_dir, f"{stage}.png"), img)
+
+
+def canny_bytes(
+    data: bytes,
+    resolution: tuple[int, int] = (RESOLUTION_HORIZONTAL, RESOLUTION_VERTICAL),
+) -> np.ndarray:
+    """
+    Edges of an encoded image (JPEG, PNG, ...) held in memory
+    """
+    return Preprocessor(resolution).edges(data)
+
+
+def canny(
+    img_path: str,
+    resolution: tuple[int, int] = (RESOLUTION_HORIZONTAL, RESOLUTION_VERTICAL),
+    debug_dir: str | None = None,
+) -> np.ndarray:
+    return Preprocessor(resolution, debug_dir=debug_dir).edges(img_path)
+
+
+def main():
+    if len(argv) not in (2, 3):
+        print("Nuh uh! Supply an image and optionally a directory for each stage")
+        return
+
+    edges = canny(argv[1], screen_resolution(), argv[2] if len(argv) == 3 else None)
+    print(f"{edges.shape[1]}x{edges.shape[0]}, {np.count_nonzero(edges)} edge pixels")
 
 
 if __name__ == "__main__":
-    img = canny("images/cat.jpg")
+    main()
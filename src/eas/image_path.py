@@ -1,104 +1,169 @@
 import image
-import json
 import numpy as np
 import math
+from collections.abc import Iterator
 from sys import argv
-from command import Command
-
-visited_pixels: set[tuple[int, int]] = set()
+from command import Command, Move, save_commands
+from lines import fit_moves, simplify
+from profiler import PhaseProfiler, phase
+
+CHECK_OFFSETS = [
+    (0, 1),
+    (0, -1),
+    (1, 0),
+    (-1, 0),
+    (1, 1),
+    (1, -1),
+    (-1, 1),
+    (-1, -1),
+]
 
 
 def sign(x: int) -> int:
     return int(math.copysign(1, x)) if x != 0 else 0
 
 
-# yields offsets in a spiral pattern, uses (y, x)
-def generate_spiral_offsets():
-    radius = 1
-    directions = [
-        (0, 1),
-        (1, 0),
-        (0, -1),
-        (-1, 0),
-    ]
-
-    while True:
-        current_x = -radius
-        current_y = -radius
-        for dir_y, dir_x in directions:
-            while True:
-                yield (current_y, current_x)
-                current_x += dir_x
-                current_y += dir_y
-
-                if abs(current_x) == radius and abs(current_y) == radius:
-                    # Go to next direction
-                    break
-
-        radius += 1
-
-
-def spiral_search(image: np.ndarray, origin: tuple[int, int]) -> tuple[int, int]:
-    origin_y, origin_x = origin
-    height, width = image.shape
-
-    for i, (offset_y, offset_x) in enumerate(generate_spiral_offsets()):
-        current_y = origin_y + offset_y
-        current_x = origin_x + offset_x
-        current_pos = (current_y, current_x)
-
-        # Discard out of bounds
-        if current_y < 0 or current_y >= height or current_x < 0 or current_x >= width:
-            continue
-
-        # Discard black pixels
-        if image[current_y, current_x] != 255:
-            continue
-
-        # Discard visited pixels
-        if current_pos in visited_pixels:
-            continue
-
-        return current_pos
-
-
-def cross_x_search(
-    image: np.ndarray, origin: tuple[int, int]
-) -> tuple[int, int] | None:
-    check_offsets = [
-        (0, 1),
-        (0, -1),
-        (1, 0),
-        (-1, 0),
-        (1, 1),
-        (1, -1),
-        (-1, 1),
-        (-1, -1),
-    ]
-
-    origin_y, origin_x = origin
-    height, width = image.shape
-
-    for offset_y, offset_x in check_offsets:
-        current_y = origin_y + offset_y
-        current_x = origin_x + offset_x
-        current_pos = (current_y, current_x)
-
-        # Discard out of bounds
-        if current_y < 0 or current_y >= height or current_x < 0 or current_x >= width:
-            continue
-
-        # Discard black pixels
-        if image[current_y, current_x] != 255:
-            continue
+def spiral_order(offset_y: np.ndarray, offset_x: np.ndarray) -> np.ndarray:
+    """
+    Where offsets sit in the spiral search order within their ring: clockwise
+    from the top left corner, along the top first. Uses (y, x).
+    """
+    radius = np.maximum(np.abs(offset_y), np.abs(offset_x))
+    return np.select(
+        [
+            (offset_y == -radius) & (offset_x < radius),
+            (offset_x == radius) & (offset_y < radius),
+            (offset_y == radius) & (offset_x > -radius),
+        ],
+        [
+            offset_x + radius,
+            3 * radius + offset_y,
+            5 * radius - offset_x,
+        ],
+        7 * radius - offset_y,
+    )
+
+
+class PathPlanner:
+    """
+    Plans one edge image. Visited pixels are kept in a boolean bitmap on the
+    planner rather than globally, so any number can plan side by side. A
+    profiler records where the time goes.
+    """
+
+    def __init__(self, image: np.ndarray, profiler: PhaseProfiler | None = None):
+        self.edges = image == 255
+        self.visited = np.zeros(image.shape, bool)
+        self.visited_count = 0
+        self.profiler = profiler
+
+    def visit(self, point: tuple[int, int]):
+        if not self.visited[point]:
+            self.visited[point] = True
+            self.visited_count += 1
+
+    def is_unvisited(self, point: tuple[int, int]) -> bool:
+        y, x = point
+        height, width = self.edges.shape
+        return (
+            0 <= y < height
+            and 0 <= x < width
+            and self.edges[y, x]
+            and not self.visited[y, x]
+        )
 
-        # Discard visited pixels
-        if current_pos in visited_pixels:
-            continue
+    def spiral_search(self, origin: tuple[int, int]) -> tuple[int, int] | None:
+        """
+        Closest unvisited edge pixel to origin, origin itself aside, by
+        chebyshev distance, ties going to whichever a spiral out from origin
+        would reach first. Looks in a window around origin that doubles in
+        size until there's something in it.
+        """
+        origin_y, origin_x = origin
+        height, width = self.edges.shape
+
+        radius = 1
+        while True:
+            top = max(origin_y - radius, 0)
+            left = max(origin_x - radius, 0)
+            window = (
+                slice(top, origin_y + radius + 1),
+                slice(left, origin_x + radius + 1),
+            )
+            unvisited = self.edges[window] & ~self.visited[window]
+            unvisited[origin_y - top, origin_x - left] = False
+            ys, xs = np.nonzero(unvisited)
+            if len(ys):
+                break
+            if top == 0 and left == 0 and radius >= max(height, width):
+                return None
+            radius *= 2
+
+        # Everything within radius is in the window, so the closest is too
+        offset_y = ys + top - origin_y
+        offset_x = xs + left - origin_x
+        dists = np.maximum(np.abs(offset_y), np.abs(offset_x))
+        closest = dists == dists.min()
+        offset_y, offset_x = offset_y[closest], offset_x[closest]
+        i = int(np.argmin(spiral_order(offset_y, offset_x)))
+
+        return origin_y + int(offset_y[i]), origin_x + int(offset_x[i])
+
+    def cross_x_search(self, origin: tuple[int, int]) -> tuple[int, int] | None:
+        origin_y, origin_x = origin
+        for offset_y, offset_x in CHECK_OFFSETS:
+            current_pos = (origin_y + offset_y, origin_x + offset_x)
+            if self.is_unvisited(current_pos):
+                return current_pos
+
+        return None
+
+    def generate_path(self) -> list[Command]:
+        return list(self.iter_path())
+
+    def iter_path(self) -> Iterator[Command]:
+        """
+        Yields the path's commands as soon as each one is planned
+        """
+        num_whites = int(np.count_nonzero(self.edges))
+
+        current_pos = (0, 0)
+        while self.visited_count < num_whites:
+            with phase(self.profiler, "spiral_search"):
+                found_point = self.spiral_search(current_pos)
+            if self.profiler is not None:
+                self.profiler.observe(
+                    "jump_distance",
+                    max(
+                        abs(found_point[0] - current_pos[0]),
+                        abs(found_point[1] - current_pos[1]),
+                    ),
+                )
+
+            yield from self.traverse(current_pos, found_point)
+            current_pos = found_point
+            self.visit(current_pos)
 
-        return current_pos
+            while True:
+                with phase(self.profiler, "cross_x_search"):
+                    next_point = self.cross_x_search(current_pos)
+                if next_point is None:
+                    break
 
-    return None
+                yield from self.traverse(current_pos, next_point)
+                current_pos = next_point
+                self.visit(current_pos)
+
+    def traverse(
+        self, start_point: tuple[int, int], end_point: tuple[int, int]
+    ) -> list[Command]:
+        with phase(self.profiler, "traverse_to_point"):
+            commands = traverse_to_point(start_point, end_point)
+        if self.profiler is not None:
+            self.profiler.touched(
+                "traverse_to_point", sum(com.steps for com in commands)
+            )
+        return commands
 
 
 def traverse_to_point(
@@ -116,9 +181,10 @@ def traverse_to_point(
     y_dir = sign(y_dist)
     x_dir = sign(x_dist)
 
-    commands.append(Command(x=x_dir, y=y_dir, steps=diagonal_dist))
+    if diagonal_dist > 0:
+        commands.append(Command(x=x_dir, y=y_dir, steps=diagonal_dist))
 
-    if diagonal_dist > 0 and 2 * diagonal_dist < abs(x_dist) + abs(y_dist):
+    if 2 * diagonal_dist < abs(x_dist) + abs(y_dist):
         current_x = start_point_x + diagonal_dist * x_dir
         current_y = start_point_y + diagonal_dist * y_dir
         dist = abs(end_point_x - current_x) + abs(end_point_y - current_y)
@@ -134,27 +200,20 @@ def traverse_to_point(
     return commands
 
 
-def generate_path(image: np.ndarray) -> list[Command]:
-    commands = []
-    num_whites = np.sum(image == 255)
-    print(num_whites)
-
-    current_pos = (0, 0)
-    while len(visited_pixels) < num_whites:
-        found_point = spiral_search(image, current_pos)
-
-        commands.extend(traverse_to_point(current_pos, found_point))
-        current_pos = found_point
-        visited_pixels.add(current_pos)
-
-        while True:
-            next_point = cross_x_search(image, current_pos)
-            if next_point is None:
-                break
+def generate_path(
+    image: np.ndarray,
+    fit_tolerance: float | None = None,
+    simplify_tolerance: float | None = None,
+    profiler: PhaseProfiler | None = None,
+) -> list[Command | Move]:
+    commands = PathPlanner(image, profiler).generate_path()
 
-            commands.extend(traverse_to_point(current_pos, next_point))
-            current_pos = next_point
-            visited_pixels.add(current_pos)
+    if simplify_tolerance is not None:
+        with phase(profiler, "simplify"):
+            commands = simplify(commands, simplify_tolerance)
+    if fit_tolerance is not None:
+        with phase(profiler, "fit_moves"):
+            return fit_moves(commands, fit_tolerance)
 
     return commands
 
@@ -166,18 +225,7 @@ def main():
 
     coms = generate_path(image.canny(argv[1]))
 
-    with open("cat.jsonl", "w") as file:
-        file.write('{"steps": 8192, "x_dir": 1, "y_dir": 1}\n')
-
-        for com in coms:
-            STEPS_PER_PIXEL = 100
-            inst = {
-                "steps": abs(com.steps) * STEPS_PER_PIXEL,
-                "x_dir": com.x,
-                "y_dir": com.y,
-            }
-            file.write(f"{json.dumps(inst)}\n")
-            # print(f"x: {com.x}, y: {com.y}, steps: {com.steps * STEPS_PER_PIXEL}")
+    save_commands("cat.jsonl", coms)
 
 
 if __name__ == "__main__":
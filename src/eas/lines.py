@@ -0,0 +1,224 @@
+import numpy as np
+from itertools import pairwise
+from sys import argv
+from command import Command, Move, delta, sign
+from constants import RESOLUTION_HORIZONTAL, SCREEN_WIDTH_MM, STEPS_PER_PIXEL
+
+FIT_TOLERANCE = 0.5  # how far (in command units) a corner may be off the fitted line
+MAX_FIT_COMMANDS = 256  # longest run of commands folded into one move
+SIMPLIFY_TOLERANCE = 0.5  # how far (in command units) simplify may stray
+
+
+def vertices(commands: list[Command | Move]) -> np.ndarray:
+    """
+    Corners of the path the commands trace, as (x, y) starting at (0, 0)
+    """
+    deltas = np.array([delta(com) for com in commands]).reshape(-1, 2)
+    return np.vstack(((0, 0), np.cumsum(deltas, axis=0)))
+
+
+def fits_line(points: np.ndarray, tolerance: float) -> bool:
+    """
+    Checks that every point lies within tolerance of the line from the first to
+    the last, and that they go along it without doubling back
+    """
+    start, end = points[0], points[-1]
+    line = end - start
+    line_length = np.hypot(*line)
+    if line_length == 0:
+        return False
+
+    offsets = points - start
+    off_line = np.abs(offsets[:, 0] * line[1] - offsets[:, 1] * line[0]) / line_length
+    along = offsets @ line
+    return bool(np.all(off_line <= tolerance) and np.all(np.diff(along) >= 0))
+
+
+def fit_moves(
+    commands: list[Command | Move], tolerance: float = FIT_TOLERANCE
+) -> list[Command | Move]:
+    """
+    Replaces every run of commands that stays within tolerance of a straight
+    line with a single Move along it, so staircases become sloped lines.
+    """
+    points = vertices(commands)
+    result = []
+
+    i = 0
+    while i < len(commands):
+        j = i + 1
+        while (
+            j < len(commands)
+            and j - i < MAX_FIT_COMMANDS
+            and fits_line(points[i : j + 2], tolerance)
+        ):
+            j += 1
+
+        if j - i == 1:
+            result.append(commands[i])
+        else:
+            dx, dy = (points[j] - points[i]).tolist()
+            result.append(Move(dx=dx, dy=dy))
+        i = j
+
+    return result
+
+
+def mm_to_pixels(mm: float) -> float:
+    """
+    Planned images span the screen's width, see image.screen_resolution
+    """
+    return mm * RESOLUTION_HORIZONTAL / SCREEN_WIDTH_MM
+
+
+def segment_distances(
+    points: np.ndarray, start: np.ndarray, end: np.ndarray
+) -> np.ndarray:
+    """
+    Distance from each point to the segment from start to end
+    """
+    line = end - start
+    offsets = points - start
+    length_sq = line @ line
+    if length_sq == 0:
+        return np.hypot(offsets[:, 0], offsets[:, 1])
+
+    along = np.clip(offsets @ line / length_sq, 0, 1)
+    off_segment = offsets - np.outer(along, line)
+    return np.hypot(off_segment[:, 0], off_segment[:, 1])
+
+
+def rdp(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Ramer-Douglas-Peucker: indices of the points to keep so that none of the
+    others is further than tolerance from the segment that replaces it
+    """
+    keep = np.zeros(len(points), bool)
+    keep[[0, -1]] = True
+    spans = [(0, len(points) - 1)]
+
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+
+        distances = segment_distances(
+            points[first + 1 : last], points[first], points[last]
+        )
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            spans.extend(((first, split), (split, last)))
+
+    return np.flatnonzero(keep)
+
+
+def max_deviation(points: np.ndarray, kept: np.ndarray) -> float:
+    """
+    How far the points get from the polyline through the kept ones
+    """
+    deviation = 0.0
+    for first, last in pairwise(kept):
+        if last - first > 1:
+            distances = segment_distances(
+                points[first + 1 : last], points[first], points[last]
+            )
+            deviation = max(deviation, float(distances.max()))
+
+    return deviation
+
+
+def segment_command(dx: int, dy: int) -> Command | Move:
+    """
+    A Command when the segment runs along one of the 8 directions, otherwise a
+    Move
+    """
+    if dx == 0 or dy == 0 or abs(dx) == abs(dy):
+        return Command(x=sign(dx), y=sign(dy), steps=max(abs(dx), abs(dy)))
+    return Move(dx=dx, dy=dy)
+
+
+def simplify_path(
+    commands: list[Command | Move], tolerance: float = SIMPLIFY_TOLERANCE
+) -> tuple[list[Command | Move], float]:
+    """
+    Treats the commands as one polyline through their corners, simplifies it
+    with rdp and emits a command per segment that's left. Returns those and
+    the furthest any corner ended up from the new path.
+    """
+    if not commands:
+        return [], 0.0
+
+    points = vertices(commands)
+    kept = rdp(points, tolerance)
+    segments = np.diff(points[kept], axis=0).tolist()
+
+    return (
+        [segment_command(dx, dy) for dx, dy in segments if dx or dy],
+        max_deviation(points, kept),
+    )
+
+
+def simplify(
+    commands: list[Command | Move], tolerance: float = SIMPLIFY_TOLERANCE
+) -> list[Command | Move]:
+    return simplify_path(commands, tolerance)[0]
+
+
+def coverage_loss(
+    commands: list[Command | Move],
+    simplified: list[Command | Move],
+    steps_per_pixel: int = 1,
+) -> dict:
+    """
+    How much of what the commands draw the simplified ones still go over,
+    and how many pixels they draw that the commands didn't
+    """
+    import simulate
+
+    positions = simulate.pen_steps(commands)
+    everywhere = np.vstack(((0, 0), positions, simulate.pen_steps(simplified)))
+    origin = everywhere.min(axis=0)
+    width, height = ((everywhere.max(axis=0) - origin) // steps_per_pixel + 2).tolist()
+
+    passes, _ = simulate.rasterise(positions, (height, width), steps_per_pixel, origin)
+    edges = np.where(passes > 0, 255, 0)
+    stats, _ = simulate.simulate(simplified, edges, steps_per_pixel, origin)
+
+    return {"coverage": stats["coverage"], "stray_pixels": stats["stray_pixels"]}
+
+
+def main():
+    if len(argv) not in (3, 4):
+        print(
+            "Nuh uh! Supply a command file, a tolerance in mm and optionally an "
+            "output file"
+        )
+        return
+
+    from toolfile import load_commands, planned_size, write_toolfile
+
+    commands = load_commands(argv[1])
+    # Command files are in motor steps
+    tolerance = mm_to_pixels(float(argv[2])) * STEPS_PER_PIXEL
+    simplified, deviation = simplify_path(commands, tolerance)
+    loss = coverage_loss(commands, simplified, STEPS_PER_PIXEL)
+
+    print(
+        f"{len(commands)} -> {len(simplified)} commands "
+        f"({1 - len(simplified) / max(len(commands), 1):.0%} fewer), "
+        f"max deviation {deviation / STEPS_PER_PIXEL:.2f} px, "
+        f"{deviation / mm_to_pixels(1) / STEPS_PER_PIXEL:.2f} mm"
+    )
+    print(
+        f"Goes over {loss['coverage']:.1%} of the pixels the original draws, "
+        f"draws {loss['stray_pixels']} it doesn't"
+    )
+
+    if len(argv) == 4:
+        write_toolfile(argv[3], simplified, *planned_size(argv[1]))
+
+
+if __name__ == "__main__":
+    main()
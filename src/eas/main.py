@@ -1,10 +1,16 @@
-import RPi.GPIO as GPIO
-import time
-import json
-
+from collections.abc import Iterable, Iterator
+from itertools import islice
 from sys import argv
-from enum import Enum
-from command import Command
+import compiler
+from checkpoint import CHECKPOINT_FILE, Checkpoint, Checkpointer, load_checkpoint
+from command import Command, Move
+from gpio_backend import load_gpio
+from plotter import Direction, Plotter
+from scheduler import StepScheduler
+from telemetry import TELEMETRY_LOG, Telemetry, serve_metrics
+from toolfile import iter_commands
+
+GPIO = load_gpio()
 
 # 21 mm horizontally
 # 19 mm vertically
@@ -15,162 +21,225 @@ SCREEN_WIDTH_MM = 185
 X_MOTOR_PINS = [17, 18, 27, 22]
 Y_MOTOR_PINS = [5, 6, 12, 13]
 
-STEP_SLEEP_SECS = 0.002  # careful lowering this, at some point you run into the mechanical limitation of how quick your motor can move
-STEPS_PER_TURN = 4096  # 5.625*(1/64) per step, 4096 steps is 360°
-BACKLASH_COMPENSATION_STEPS = 200  # Number of steps needed to compensate for backlash
-
-# stepper motor sequence (found in documentation http://www.4tronix.co.uk/arduino/Stepper-Motors.php)
-STEP_SEQUENCE = [
-    [1, 0, 0, 1],
-    [1, 0, 0, 0],
-    [1, 1, 0, 0],
-    [0, 1, 0, 0],
-    [0, 1, 1, 0],
-    [0, 0, 1, 0],
-    [0, 0, 1, 1],
-    [0, 0, 0, 1],
-]
-
-
-class Direction(Enum):
-    POSITIVE = 1
-    ZERO = 0
-    NEGATIVE = -1
-
+COMPILE_CHUNK = 64  # commands compiled at a time
+
+plotter = Plotter(GPIO, X_MOTOR_PINS, Y_MOTOR_PINS)
+scheduler = StepScheduler()
+telemetry = Telemetry(scheduler, TELEMETRY_LOG)
+
+
+# progress through the job being drawn, kept for checkpoints
+checkpointer: Checkpointer | None = None
+job = Checkpoint(file="")
+
+
+def draw_from_file(commands: Iterable[Command | Move], start: Checkpoint | None = None):
+    """
+    Draws the commands, or the rest of them from where a checkpoint left off.
+    They're compiled COMPILE_CHUNK at a time (see compiler.py), so each tick
+    only writes the pins that change, and drawing can start before the rest
+    have been read or planned.
+    """
+    start_index = start.command_index if start is not None else 0
+    start_tick = start.ticks_done if start is not None else 0
+    commands = islice(commands, start_index, None)
+
+    index = start_index
+    while chunk := list(islice(commands, COMPILE_CHUNK)):
+        compiled = compiler.compile_commands(
+            plotter, chunk, start_tick if index == start_index else 0
+        )
+        starts = compiled.starts.tolist()
+        periods = compiled.ticks["period"]
+
+        for offset, command in enumerate(chunk):
+            job.command_index = index + offset
+            job.ticks_done = start_tick if index + offset == start_index else 0
+            job.x_dir, job.y_dir = compiled.directions[offset].tolist()
+
+            run(compiler.command_ticks(plotter, compiled, offset))
+
+            start, end = starts[offset], starts[offset + 1]
+            telemetry.command_done(
+                command,
+                (job.x_dir, job.y_dir),
+                end - start,
+                float(periods[start:end].sum()),
+            )
 
-x_motor_sequence_index = 0
-y_motor_sequence_index = 0
+        index += len(chunk)
 
-current_x_dir = Direction.ZERO
-current_y_dir = Direction.ZERO
 
+def ticked():
+    """
+    Counts a tick of the current command, saving a checkpoint when one's due
+    """
+    job.ticks_done += 1
+    if checkpointer is not None and checkpointer.due():
+        save_checkpoint()
 
-def load_file(filename: str) -> list[Command]:
-    commands = []
-    with open(filename, "r") as file:
-        lines = file.readlines()
-        for line in lines:
-            inst = json.loads(line)
-            commands.append(
-                Command(x=inst["x_dir"], y=inst["y_dir"], steps=inst["steps"])
-            )
 
-    return commands
+def save_checkpoint():
+    job.x_motor_sequence_index = plotter.x.sequence_index
+    job.y_motor_sequence_index = plotter.y.sequence_index
+    checkpointer.save(job)
 
 
-def draw_from_file(commands: list[Command]):
-    for command in commands:
-        print(repr(command))
-        spin_motor(command.steps, Direction(command.x), Direction(command.y))
+def restore_checkpoint(checkpoint: Checkpoint):
+    """
+    Puts the motors back in the state they were in when the checkpoint was
+    saved, without moving them
+    """
+    plotter.x.sequence_index = checkpoint.x_motor_sequence_index
+    plotter.y.sequence_index = checkpoint.y_motor_sequence_index
+    plotter.x.direction = Direction(checkpoint.x_dir)
+    plotter.y.direction = Direction(checkpoint.y_dir)
 
 
 def setup_gpio():
-    # set up pins
     GPIO.setmode(GPIO.BCM)
-
-    for pin in X_MOTOR_PINS:
-        GPIO.setup(pin, GPIO.OUT)
-
-    for pin in Y_MOTOR_PINS:
-        GPIO.setup(pin, GPIO.OUT)
-
-    # initialize to low
-    for pin in X_MOTOR_PINS:
-        GPIO.output(pin, GPIO.LOW)
-
-    for pin in Y_MOTOR_PINS:
-        GPIO.output(pin, GPIO.LOW)
+    plotter.setup()
 
 
 def cleanup_gpio():
-    for pin in X_MOTOR_PINS:
-        GPIO.output(pin, GPIO.LOW)
-
-    for pin in Y_MOTOR_PINS:
-        GPIO.output(pin, GPIO.LOW)
-
+    plotter.release()
     GPIO.cleanup()
 
 
 def main():
-    if len(argv) != 2:
-        print("Nuh uh! Supply a single argument please")
+    global checkpointer
+
+    stream = argv[1:2] == ["--stream"]
+    if len(argv) != 2 and not (stream and len(argv) in (3, 4)):
+        print(
+            "Nuh uh! Supply a command file, --resume, or --stream with an image "
+            "and optionally a planner"
+        )
         return
 
-    commands = load_file(argv[1])
-
-    print("Moving pen to top left...")
-    reset_pen()
+    start = None
+    commands = None
+
+    if argv[1] == "--resume":
+        start = load_checkpoint()
+        if start is None:
+            print(f"Nothing to resume, no {CHECKPOINT_FILE} found")
+            return
+
+        # The pen is still where the job stopped, so no homing or shaking
+        restore_checkpoint(start)
+        job.file = start.file
+        print(
+            f"Resuming {start.file} from command {start.command_index}, "
+            f"tick {start.ticks_done}..."
+        )
+        if start.source is not None:
+            commands = stream_commands(start.source, start.planner, start.preprocessing)
+    else:
+        if stream:
+            from pipeline import stream_file
+
+            # Plans while the pen homes
+            job.file = stream_file(argv[2])
+            commands = stream_commands(argv[2], *argv[3:])
+        else:
+            job.file = argv[1]
+
+        print("Moving pen to top left...")
+        reset_pen()
+
+        input("Shake the Etch-a-Sketch to clear it, then press enter to continue: ")
+        print(f"Drawing {argv[2] if stream else argv[1]}...")
+
+    if commands is None:
+        commands = iter_commands(job.file)
+        start_job(job.file, start)
+    else:
+        # Still being planned, so there are no totals for an ETA
+        telemetry.start_job(job.file)
 
-    input("Shake the Etch-a-Sketch to clear it, then press enter to continue: ")
-    print(f"Drawing {argv[1]}...")
+    try:
+        serve_metrics(telemetry)
+    except OSError as error:
+        print(f"Not serving metrics: {error}")
 
-    draw_from_file(commands)
+    # Only the drawing is checkpointed, homing starts from scratch anyway
+    checkpointer = Checkpointer()
+    try:
+        draw_from_file(commands, start)
+    except BaseException:
+        save_checkpoint()
+        print(f"Stopped at command {job.command_index}, resume with --resume")
+        raise
+
+    checkpointer.clear()
+    telemetry.finish_job()
+
+
+def stream_commands(
+    source: str, planner: str = "toolpath", preprocessing: dict | None = None
+) -> Iterator[Command | Move]:
+    """
+    Plans source while it's drawn, recording the commands in job.file. The
+    planners are deterministic, so the job keeps what it takes to plan it
+    again for resuming, rather than relying on the file.
+    """
+    import image
+    from pipeline import PlanStream, record_commands
+
+    if preprocessing is None:
+        preprocessor = image.Preprocessor(image.screen_resolution())
+    else:
+        preprocessor = image.Preprocessor.from_params(preprocessing)
+    job.source = source
+    job.planner = planner
+    job.preprocessing = preprocessor.params()
+
+    return record_commands(PlanStream(source, planner, preprocessor), job.file)
+
+
+def start_job(filename: str, start: Checkpoint | None = None):
+    """
+    Starts telemetry for a command file, from where the checkpoint left off,
+    with the ticks and time left for its ETA. They're worked out from the
+    plotter's current state, so call it once the pen is where drawing starts.
+    """
+    start_index = start.command_index if start is not None else 0
+    start_tick = start.ticks_done if start is not None else 0
+    commands, ticks, secs = compiler.command_totals(
+        plotter, islice(iter_commands(filename), start_index, None), start_tick
+    )
+    telemetry.start_job(filename, commands, ticks, secs)
+
+
+def run(ticks):
+    for period in ticks:
+        ticked()
+        scheduler.wait(period)
 
 
 # Move the pen to the top left
 def reset_pen():
-    spin_motor(5 * STEPS_PER_TURN, x_dir=Direction.NEGATIVE, y_dir=Direction.NEGATIVE)
-
-
-def spin_motor(step_count: int, x_dir: Direction, y_dir: Direction):
-    global x_motor_sequence_index, y_motor_sequence_index
-    global current_x_dir, current_y_dir
-
-    x_fuel = step_count
-    y_fuel = step_count
-
-    if (
-        current_x_dir != Direction.ZERO
-        and x_dir != Direction.ZERO
-        and current_x_dir != x_dir
-    ):
-        x_fuel += BACKLASH_COMPENSATION_STEPS
-
-    if (
-        current_y_dir != Direction.ZERO
-        and y_dir != Direction.ZERO
-        and current_y_dir != y_dir
-    ):
-        y_fuel += BACKLASH_COMPENSATION_STEPS
-
-    if x_dir != Direction.ZERO:
-        current_x_dir = x_dir
-    if y_dir != Direction.ZERO:
-        current_y_dir = y_dir
-
-    while x_fuel > 0 or y_fuel > 0:
-        if x_fuel >= y_fuel:
-            x_fuel -= 1
-
-            if x_dir != Direction.ZERO:
-                for pin in range(0, 4):
-                    GPIO.output(
-                        X_MOTOR_PINS[pin], STEP_SEQUENCE[x_motor_sequence_index][pin]
-                    )
-
-                match x_dir:
-                    case Direction.NEGATIVE:
-                        x_motor_sequence_index = (x_motor_sequence_index + 1) % 8
-                    case Direction.POSITIVE:
-                        x_motor_sequence_index = (x_motor_sequence_index - 1) % 8
-
-        if y_fuel >= x_fuel:
-            y_fuel -= 1
-
-            if y_dir != Direction.ZERO:
-                for pin in range(0, 4):
-                    GPIO.output(
-                        Y_MOTOR_PINS[pin], STEP_SEQUENCE[y_motor_sequence_index][pin]
-                    )
-
-                match y_dir:
-                    case Direction.NEGATIVE:
-                        y_motor_sequence_index = (y_motor_sequence_index - 1) % 8
-                    case Direction.POSITIVE:
-                        y_motor_sequence_index = (y_motor_sequence_index + 1) % 8
-
-        time.sleep(STEP_SLEEP_SECS)
+    for period in plotter.home():
+        scheduler.wait(period)
+
+
+def spin_motor(
+    step_count: int, x_dir: Direction, y_dir: Direction, start_tick: int = 0
+):
+    """
+    Steps both axes step_count times, plus backlash compensation. Starting
+    from start_tick skips the ticks an interrupted run already did.
+    """
+    run(plotter.motor_ticks(step_count, x_dir, y_dir, start_tick))
+
+
+def spin_vector(dx: int, dy: int, start_tick: int = 0):
+    """
+    Moves dx steps along x and dy along y in a straight line, see
+    Plotter.vector_ticks
+    """
+    run(plotter.vector_ticks(dx, dy, start_tick))
 
 
 if __name__ == "__main__":
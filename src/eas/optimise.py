@@ -0,0 +1,227 @@
+from collections import defaultdict
+from sys import argv
+from dataclasses import replace
+from command import Command, Move, delta, write_commands
+from constants import STEP_SLEEP_SECS, STEPS_PER_PIXEL
+import cost
+from toolfile import SUFFIX, load_commands, planned_size, write_toolfile
+
+# line direction -> (line id, position along it) for a point (x, y)
+LINE_PARAMS = {
+    (1, 0): lambda x, y: (y, x),
+    (0, 1): lambda x, y: (x, y),
+    (1, 1): lambda x, y: (x - y, x),
+    (1, -1): lambda x, y: (x + y, x),
+}
+
+
+def drop_no_ops(commands: list[Command | Move]) -> list[Command | Move]:
+    """
+    Removes zero step commands and commands that move neither axis
+    """
+    return [replace(com) for com in commands if delta(com) != (0, 0)]
+
+
+def merge_runs(commands: list[Command | Move]) -> list[Command | Move]:
+    """
+    Merges consecutive commands going the same way
+    """
+    merged = []
+    for com in commands:
+        if isinstance(com, Move):
+            merged.append(replace(com))
+        elif (
+            merged
+            and isinstance(merged[-1], Command)
+            and (merged[-1].x, merged[-1].y) == (com.x, com.y)
+        ):
+            merged[-1] = Command(x=com.x, y=com.y, steps=merged[-1].steps + com.steps)
+        else:
+            merged.append(Command(x=com.x, y=com.y, steps=com.steps))
+
+    return merged
+
+
+def line_key(
+    point: tuple[int, int], direction: tuple[int, int]
+) -> tuple[tuple[int, int], int, int]:
+    """
+    Identifies the line through point along direction, and where point sits on it
+    """
+    if direction not in LINE_PARAMS:
+        direction = (-direction[0], -direction[1])
+    line, position = LINE_PARAMS[direction](*point)
+
+    return direction, line, position
+
+
+def is_drawn(
+    drawn: dict, start: tuple[int, int], direction: tuple[int, int], steps: int
+) -> bool:
+    """
+    Checks whether the segment from start, steps along direction, is covered by
+    already drawn segments on the same line
+    """
+    end = (start[0] + direction[0] * steps, start[1] + direction[1] * steps)
+    key_direction, line, lo = line_key(start, direction)
+    hi = line_key(end, direction)[2]
+    lo, hi = min(lo, hi), max(lo, hi)
+
+    reach = lo
+    for seg_lo, seg_hi in sorted(drawn[key_direction, line]):
+        if seg_lo > reach:
+            break
+        reach = max(reach, seg_hi)
+        if reach >= hi:
+            return True
+
+    return False
+
+
+def add_drawn(drawn: dict, start: tuple[int, int], com: Command):
+    direction = (com.x, com.y)
+    end = (start[0] + com.x * com.steps, start[1] + com.y * com.steps)
+    key_direction, line, lo = line_key(start, direction)
+    hi = line_key(end, direction)[2]
+    drawn[key_direction, line].append((min(lo, hi), max(lo, hi)))
+
+
+def cancel_reversals(commands: list[Command | Move]) -> list[Command | Move]:
+    """
+    Cancels a move followed by its exact reverse when the stretch it goes out
+    and back over had already been drawn. Partial overlaps shorten the longer
+    of the two. Expects merged commands without no-ops.
+    """
+    result = []
+    drawn = defaultdict(list)
+    position = (0, 0)
+
+    i = 0
+    while i < len(commands):
+        com = commands[i]
+        if isinstance(com, Move):
+            result.append(com)
+            position = (position[0] + com.dx, position[1] + com.dy)
+            i += 1
+            continue
+
+        direction = (com.x, com.y)
+        if i + 1 < len(commands) and isinstance(commands[i + 1], Command):
+            reverse = commands[i + 1]
+            overlap = min(com.steps, reverse.steps)
+            end = (position[0] + com.x * com.steps, position[1] + com.y * com.steps)
+
+            if (reverse.x, reverse.y) == (-com.x, -com.y) and is_drawn(
+                drawn, end, (reverse.x, reverse.y), overlap
+            ):
+                if com.steps > overlap:
+                    com = Command(x=com.x, y=com.y, steps=com.steps - overlap)
+                elif reverse.steps > overlap:
+                    com = Command(
+                        x=reverse.x, y=reverse.y, steps=reverse.steps - overlap
+                    )
+                else:
+                    i += 2
+                    continue
+                i += 1
+                direction = (com.x, com.y)
+
+        result.append(com)
+        add_drawn(drawn, position, com)
+        position = (
+            position[0] + direction[0] * com.steps,
+            position[1] + direction[1] * com.steps,
+        )
+        i += 1
+
+    return result
+
+
+def fold_zigzags(
+    commands: list[Command | Move], max_steps: int
+) -> list[Command | Move]:
+    """
+    Replaces a horizontal then vertical move (or the other way round) of the
+    same small length with one diagonal move, so staircases become straight
+    lines. The line moves by at most max_steps / sqrt(2).
+    """
+    folded = []
+    i = 0
+    while i < len(commands):
+        com = commands[i]
+        if i + 1 < len(commands):
+            other = commands[i + 1]
+            if (
+                isinstance(com, Command)
+                and isinstance(other, Command)
+                and com.steps == other.steps <= max_steps
+                and (com.x == 0) != (com.y == 0)
+                and (other.x == 0) != (other.y == 0)
+                and (com.x == 0) != (other.x == 0)
+            ):
+                folded.append(
+                    Command(x=com.x + other.x, y=com.y + other.y, steps=com.steps)
+                )
+                i += 2
+                continue
+
+        folded.append(com)
+        i += 1
+
+    return folded
+
+
+def optimise(
+    commands: list[Command | Move], zigzag_steps: int = 1
+) -> list[Command | Move]:
+    """
+    Runs the passes until the command stream stops shrinking. zigzag_steps is
+    in the same units as the commands, 0 leaves staircases alone.
+    """
+    commands = merge_runs(drop_no_ops(commands))
+    while True:
+        before = len(commands)
+        commands = merge_runs(cancel_reversals(commands))
+        if zigzag_steps > 0:
+            commands = merge_runs(fold_zigzags(commands, zigzag_steps))
+        if len(commands) == before:
+            return commands
+
+
+def report(
+    before: list[Command | Move], after: list[Command | Move], scale: int = 1
+) -> dict:
+    """
+    Compares two command streams, scale as in cost.draw_ticks
+    """
+    saved_ticks = cost.draw_ticks(before, scale) - cost.draw_ticks(after, scale)
+    return {
+        "commands_before": len(before),
+        "commands_after": len(after),
+        "commands_removed": len(before) - len(after),
+        "ticks_saved": saved_ticks,
+        "secs_saved": saved_ticks * STEP_SLEEP_SECS,
+    }
+
+
+def main():
+    if len(argv) != 3:
+        print("Nuh uh! Supply an input and an output file please")
+        return
+
+    commands = load_commands(argv[1])
+    optimised = optimise(commands, zigzag_steps=STEPS_PER_PIXEL)
+    if argv[2].endswith(SUFFIX):
+        write_toolfile(argv[2], optimised, *planned_size(argv[1]))
+    else:
+        write_commands(argv[2], optimised)
+
+    stats = report(commands, optimised)
+    print(
+        f"Removed {stats['commands_removed']} of {stats['commands_before']} "
+        f"commands, saving {stats['secs_saved'] / 60:.1f} min of drawing"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import cv2 as cv
+import numpy as np
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sys import argv
+import chains
+import cost
+import toolpath
+from command import Command, Move, delta, direction, save_commands
+from cost import CostModel
+
+TILE_SIZE = 64  # pixels, tiles split up components too big to plan in one go
+# Parts each worker needs before splitting beats planning the image in one go,
+# splitting and stitching draws a little longer and costs time of its own
+MIN_PARTS_PER_WORKER = 8
+
+pool: ProcessPoolExecutor | None = None
+
+
+def split_parts(
+    img: np.ndarray, tile_size: int | None = TILE_SIZE
+) -> list[tuple[np.ndarray, tuple[int, int]]]:
+    """
+    Splits an edge image into its 8-connected components, within each tile
+    when given a tile size. Returns each part cropped to its bounding box,
+    with a 1 pixel empty border, and the (y, x) of the crop's top left.
+    """
+    height, width = img.shape
+    step = tile_size or max(height, width)
+    parts = []
+
+    for tile_y in range(0, height, step):
+        for tile_x in range(0, width, step):
+            tile = (img[tile_y : tile_y + step, tile_x : tile_x + step] == 255).astype(
+                np.uint8
+            )
+            count, labels, stats, _ = cv.connectedComponentsWithStats(tile, 8)
+
+            for label in range(1, count):
+                left, top, part_width, part_height, _ = stats[label]
+                crop = labels[top : top + part_height, left : left + part_width]
+                part = np.pad(np.where(crop == label, 255, 0).astype(np.uint8), 1)
+                parts.append((part, (tile_y + top - 1, tile_x + left - 1)))
+
+    return parts
+
+
+def plan_part(
+    part: tuple[np.ndarray, tuple[int, int]], cost_model: CostModel | None
+) -> tuple[tuple[int, int], tuple[int, int], list[Command | Move]]:
+    """
+    Plans one part from its pixel closest to the crop's top left, returns where
+    it starts and ends in the whole image, (y, x), and its commands
+    """
+    img, (origin_y, origin_x) = part
+    ys, xs = np.nonzero(img == 255)
+    first = int(np.argmin(np.maximum(ys, xs)))
+    start = (int(ys[first]), int(xs[first]))
+
+    commands = toolpath.generate_toolpath(img, cost_model, start=start)
+
+    x, y = np.array([delta(com) for com in commands], int).reshape(-1, 2).sum(axis=0)
+    return (
+        (origin_y + start[0], origin_x + start[1]),
+        (origin_y + start[0] + int(y), origin_x + start[1] + int(x)),
+        commands,
+    )
+
+
+def command_directions(commands: list[Command | Move]) -> tuple[int, int, int, int]:
+    """
+    First x, first y, last x and last y direction the commands move in, like
+    chains.chain_directions
+    """
+    directions = np.array([direction(com) for com in commands], int).reshape(-1, 2)
+    moving_x = np.flatnonzero(directions[:, 0])
+    moving_y = np.flatnonzero(directions[:, 1])
+
+    first_x = directions[moving_x[0], 0] if len(moving_x) else 0
+    last_x = directions[moving_x[-1], 0] if len(moving_x) else 0
+    first_y = directions[moving_y[0], 1] if len(moving_y) else 0
+    last_y = directions[moving_y[-1], 1] if len(moving_y) else 0
+
+    return int(first_x), int(first_y), int(last_x), int(last_y)
+
+
+def reverse_commands(commands: list[Command | Move]) -> list[Command | Move]:
+    """
+    Commands that go back over the same path the other way
+    """
+    return [
+        Move(dx=-com.dx, dy=-com.dy)
+        if isinstance(com, Move)
+        else Command(x=-com.x, y=-com.y, steps=com.steps)
+        for com in reversed(commands)
+    ]
+
+
+def stitch(
+    plans: list[tuple[tuple[int, int], tuple[int, int], list[Command | Move]]],
+    start: tuple[int, int] = (0, 0),
+    cost_model: CostModel | None = None,
+) -> list[Command | Move]:
+    """
+    Orders and orients the planned parts like chains.order_chains does for
+    chains, then joins them with straight moves
+    """
+    if not plans:
+        return []
+
+    tour = chains.plan_tour(
+        np.array([plan_start for plan_start, _, _ in plans]),
+        np.array([plan_end for _, plan_end, _ in plans]),
+        np.array([command_directions(commands) for _, _, commands in plans]),
+        start,
+        cost_model,
+    )
+
+    result = []
+    current = start
+    for i, flip in zip(tour.order, tour.flipped):
+        part_start, part_end, commands = plans[i]
+        if flip:
+            part_start, part_end = part_end, part_start
+            commands = reverse_commands(commands)
+
+        result.extend(chains.line_commands(current, part_start))
+        result.extend(commands)
+        current = part_end
+
+    return result
+
+
+def worker_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    The process pool with this many workers, kept between calls as starting
+    the processes takes longer than planning most images
+    """
+    global pool
+    if pool is None or pool._max_workers != workers:
+        if pool is not None:
+            pool.shutdown()
+        pool = ProcessPoolExecutor(workers)
+    return pool
+
+
+def generate_toolpath(
+    img: np.ndarray,
+    cost_model: CostModel | None = None,
+    tile_size: int | None = TILE_SIZE,
+    workers: int | None = None,
+) -> list[Command | Move]:
+    """
+    Plans the parts of the image (see split_parts) with toolpath in a process
+    pool, then stitches them together. tile_size None splits by component only.
+    With one worker, or too few parts to keep the workers busy, it's planned
+    in one go by toolpath.generate_toolpath instead.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return toolpath.generate_toolpath(img, cost_model)
+
+    parts = split_parts(img, tile_size)
+    if len(parts) < workers * MIN_PARTS_PER_WORKER:
+        return toolpath.generate_toolpath(img, cost_model)
+
+    chunksize = max(len(parts) // (workers * 4), 1)
+    plans = list(
+        worker_pool(workers).map(
+            plan_part, parts, [cost_model] * len(parts), chunksize=chunksize
+        )
+    )
+
+    return stitch(plans, cost_model=cost_model)
+
+
+def main():
+    if len(argv) not in (2, 3):
+        print("Nuh uh! Supply an image and optionally an output file please")
+        return
+
+    import image
+
+    edges = image.canny(argv[1])
+    workers = os.cpu_count() or 1
+
+    # Warm the pool up first, it's kept between calls
+    if workers > 1:
+        worker_pool(workers).submit(int).result()
+
+    start_time = time.perf_counter()
+    coms = generate_toolpath(edges.copy(), CostModel(), workers=workers)
+    parallel_secs = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    serial_coms = toolpath.generate_toolpath(edges.copy(), CostModel())
+    serial_secs = time.perf_counter() - start_time
+
+    print(
+        f"Parallel planner ({workers} workers): {parallel_secs:.2f} s, "
+        f"{len(coms)} commands, "
+        f"{cost.draw_time_secs(coms) / 60:.1f} min"
+    )
+    print(
+        f"Serial planner: {serial_secs:.2f} s, {len(serial_coms)} commands, "
+        f"{cost.draw_time_secs(serial_coms) / 60:.1f} min"
+    )
+
+    if len(argv) == 3:
+        save_commands(argv[2], coms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import json
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+import traceback
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from sys import argv
+import image
+import image_path
+import toolpath
+from command import Command, Move, iter_motor_commands, to_dict
+from cost import CostModel
+
+JOBS_DIR = "jobs"
+QUEUE_CHUNKS = 32  # chunks the planner may get ahead of the motors by
+CHUNK_COMMANDS = 16  # commands handed over at a time
+WORKER_CHECK_SECS = 1.0  # how often a waiting stream checks the planner is alive
+
+
+class PlanError(RuntimeError):
+    """
+    Planning failed in the planning process, with its traceback
+    """
+
+
+# Planners that yield commands as they plan them
+STREAM_PLANNERS = {
+    "toolpath": lambda edges: toolpath.iter_toolpath(edges, CostModel()),
+    "image_path": lambda edges: image_path.PathPlanner(edges).iter_path(),
+}
+
+
+def plan_worker(
+    source: str | bytes,
+    planner: str,
+    preprocessor: image.Preprocessor,
+    chunks: multiprocessing.Queue,
+):
+    """
+    Runs in the planning process: plans the image and puts its motor commands
+    on chunks a few at a time, then None, or the traceback of the error it
+    failed with. Waits whenever chunks is full.
+    """
+    try:
+        edges = preprocessor.edges(source)
+        commands = iter_motor_commands(STREAM_PLANNERS[planner](edges))
+        while chunk := list(islice(commands, CHUNK_COMMANDS)):
+            chunks.put(chunk)
+        chunks.put(None)
+    except Exception:
+        # Whatever went wrong, the stream waiting on chunks has to hear of it.
+        # As text, as not every exception pickles.
+        chunks.put(traceback.format_exc())
+
+
+class PlanStream:
+    """
+    Plans an image (a path or encoded bytes) in a process of its own, starting
+    straight away, and hands its motor commands over as they come. Iterating
+    waits for the next ones, and the planner waits when it gets QUEUE_CHUNKS
+    ahead. A process rather than a thread, so planning never holds the GIL
+    while the motors are being stepped.
+    """
+
+    def __init__(
+        self,
+        source: str | bytes,
+        planner: str = "toolpath",
+        preprocessor: image.Preprocessor | None = None,
+        max_chunks: int = QUEUE_CHUNKS,
+    ):
+        if planner not in STREAM_PLANNERS:
+            raise ValueError(
+                f"Unknown planner {planner}, expected one of {list(STREAM_PLANNERS)}"
+            )
+        if preprocessor is None:
+            preprocessor = image.Preprocessor(image.screen_resolution())
+
+        # Spawned rather than forked, whoever's drawing may have threads running
+        context = multiprocessing.get_context("spawn")
+        self.chunks = context.Queue(max_chunks)
+        self.process = context.Process(
+            target=plan_worker,
+            args=(source, planner, preprocessor, self.chunks),
+            daemon=True,
+        )
+        self.process.start()
+
+    def __iter__(self) -> Iterator[Command | Move]:
+        try:
+            while (chunk := self.next_chunk()) is not None:
+                if isinstance(chunk, str):
+                    raise PlanError(f"planning failed:\n{chunk}")
+                yield from chunk
+        finally:
+            self.close()
+
+    def next_chunk(self) -> list | str | None:
+        while True:
+            try:
+                return self.chunks.get(timeout=WORKER_CHECK_SECS)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+
+        # It may have put its last chunk just before it exited
+        try:
+            return self.chunks.get_nowait()
+        except queue.Empty:
+            raise RuntimeError(
+                f"planner exited with code {self.process.exitcode}"
+            ) from None
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+def stream_file(source: str, jobs_dir: str = JOBS_DIR) -> str:
+    """
+    A new file in jobs_dir to record the commands streamed from source in
+    """
+    os.makedirs(jobs_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(source))[0]
+    fd, path = tempfile.mkstemp(suffix=".jsonl", prefix=f"{name}-", dir=jobs_dir)
+    os.close(fd)
+    return path
+
+
+def record_commands(
+    commands: Iterable[Command | Move], filename: str
+) -> Iterator[Command | Move]:
+    """
+    Passes commands through, writing each one to a JSONL file as it's handed
+    on. The file only holds what's been taken so far, a stream is resumed by
+    planning it again, not from the file.
+    """
+    with open(filename, "w") as file:
+        for com in commands:
+            file.write(f"{json.dumps(to_dict(com))}\n")
+            file.flush()
+            yield com
+
+
+def main():
+    if len(argv) not in (2, 3, 4):
+        print("Nuh uh! Supply an image and optionally a planner and a width")
+        return
+
+    planner = argv[2] if len(argv) >= 3 else "toolpath"
+    width = int(argv[3]) if len(argv) == 4 else image.RESOLUTION_HORIZONTAL
+    preprocessor = image.Preprocessor(image.screen_resolution(width))
+
+    # How long the motors would wait for their first command, against
+    # planning the whole image first
+    start_time = time.perf_counter()
+    stream = iter(PlanStream(argv[1], planner, preprocessor))
+    next(stream)
+    first_secs = time.perf_counter() - start_time
+    count = 1 + sum(1 for _ in stream)
+    stream_secs = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    edges = preprocessor.edges(argv[1])
+    commands = list(iter_motor_commands(list(STREAM_PLANNERS[planner](edges))))
+    batch_secs = time.perf_counter() - start_time
+
+    print(
+        f"{count} commands, first after {first_secs:.2f} s, "
+        f"all after {stream_secs:.2f} s streamed"
+    )
+    print(f"{len(commands)} commands, first after {batch_secs:.2f} s planned up front")
+
+
+if __name__ == "__main__":
+    main()
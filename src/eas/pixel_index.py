@@ -0,0 +1,148 @@
+import numpy as np
+
+CELL_SIZE = 16
+
+
+class PixelIndex:
+    """
+    Keeps track of the remaining (255) pixels of an edge image.
+
+    The image is split into square cells with a live count of remaining pixels
+    per cell, so "anything left?" is a counter check and the nearest search
+    only has to look inside non-empty cells close to the origin.
+
+    Given a DrawnIndex, pixels marked as drawn are added to it too.
+    """
+
+    def __init__(self, img: np.ndarray, cell_size: int = CELL_SIZE, drawn=None):
+        self.img = img
+        self.cell_size = cell_size
+        self.drawn = drawn
+
+        height, width = img.shape
+        grid_height = -(-height // cell_size)
+        grid_width = -(-width // cell_size)
+
+        padded = np.zeros((grid_height * cell_size, grid_width * cell_size), bool)
+        padded[:height, :width] = img == 255
+        self.counts = padded.reshape(grid_height, cell_size, grid_width, cell_size).sum(
+            axis=(1, 3)
+        )
+        self.remaining = int(self.counts.sum())
+
+    def mark(self, point: tuple[int, int]):
+        """
+        Marks a pixel as drawn (1), keeping the counts in sync
+        """
+        y, x = point
+        if self.img[y, x] == 255:
+            self.counts[y // self.cell_size, x // self.cell_size] -= 1
+            self.remaining -= 1
+        self.img[y, x] = 1
+        if self.drawn is not None:
+            self.drawn.add(point)
+
+    def nearest(self, origin: tuple[int, int]) -> tuple[int, int] | None:
+        """
+        Returns the remaining pixel closest to origin, or None if empty. The
+        same pixel the square search in toolpath.find_next_point finds: the
+        closest by chebyshev distance, ties going to whichever it scans first.
+        """
+        if self.remaining == 0:
+            return None
+
+        y, x = origin
+        grid_height, grid_width = self.counts.shape
+        cell_y = min(max(y // self.cell_size, 0), grid_height - 1)
+        cell_x = min(max(x // self.cell_size, 0), grid_width - 1)
+
+        best = None
+        best_dist = None
+        best_order = None
+        for radius in range(max(grid_height, grid_width)):
+            # Pixels in a ring this far out can't beat what we already have
+            if best_dist is not None and (radius - 1) * self.cell_size >= best_dist:
+                break
+
+            for ring_y, ring_x in self._ring_cells(cell_y, cell_x, radius):
+                point, dist, order = self._nearest_in_cell(ring_y, ring_x, origin)
+                if best_dist is None or (dist, order) < (best_dist, best_order):
+                    best, best_dist, best_order = point, dist, order
+
+        return best
+
+    def _ring_cells(self, cell_y: int, cell_x: int, radius: int):
+        """
+        Yields the non-empty cells on the square ring around a cell
+        """
+        grid_height, grid_width = self.counts.shape
+        min_y, max_y = cell_y - radius, cell_y + radius
+        min_x, max_x = cell_x - radius, cell_x + radius
+
+        if radius == 0:
+            if self.counts[cell_y, cell_x] > 0:
+                yield cell_y, cell_x
+            return
+
+        clip_min_x = max(min_x, 0)
+        clip_max_x = min(max_x, grid_width - 1)
+        for row in (min_y, max_y):
+            if 0 <= row < grid_height:
+                for col in np.flatnonzero(
+                    self.counts[row, clip_min_x : clip_max_x + 1]
+                ):
+                    yield row, clip_min_x + int(col)
+
+        clip_min_y = max(min_y + 1, 0)
+        clip_max_y = min(max_y - 1, grid_height - 1)
+        for col in (min_x, max_x):
+            if 0 <= col < grid_width:
+                for row in np.flatnonzero(
+                    self.counts[clip_min_y : clip_max_y + 1, col]
+                ):
+                    yield clip_min_y + int(row), col
+
+    def _nearest_in_cell(
+        self, cell_y: int, cell_x: int, origin: tuple[int, int]
+    ) -> tuple[tuple[int, int], int, int]:
+        """
+        The cell's remaining pixel closest to origin, its distance and where
+        it comes in find_next_point's scan of that distance
+        """
+        top = cell_y * self.cell_size
+        left = cell_x * self.cell_size
+        block = self.img[top : top + self.cell_size, left : left + self.cell_size]
+
+        ys, xs = np.nonzero(block == 255)
+        ys = ys + top
+        xs = xs + left
+        dists = np.maximum(np.abs(ys - origin[0]), np.abs(xs - origin[1]))
+        closest = dists == dists.min()
+        ys, xs = ys[closest], xs[closest]
+        dist = int(dists.min())
+
+        orders = self._scan_order(ys, xs, origin, dist)
+        i = int(np.argmin(orders))
+
+        return (int(ys[i]), int(xs[i])), dist, int(orders[i])
+
+    def _scan_order(
+        self, ys: np.ndarray, xs: np.ndarray, origin: tuple[int, int], dist: int
+    ) -> np.ndarray:
+        """
+        The order find_next_point checks pixels dist from origin in: the top
+        and bottom rows of its (clipped) search box column by column, then
+        the left and right columns row by row
+        """
+        height, width = self.img.shape
+        y, x = origin
+        box_top = max(y - dist, 0)
+        box_bottom = min(y + dist, height - 1)
+        box_left = max(x - dist, 0)
+
+        on_rows = (ys == box_top) | (ys == box_bottom)
+        return np.where(
+            on_rows,
+            xs * 2 + (ys != box_top),
+            2 * width + ys * 2 + (xs != box_left),
+        )
@@ -0,0 +1,211 @@
+from collections.abc import Iterator
+from enum import Enum
+from command import Command, Move, sign
+from constants import BACKLASH_COMPENSATION_STEPS
+from scheduler import trapezoid_periods
+
+STEPS_PER_TURN = 4096  # 5.625*(1/64) per step, 4096 steps is 360°
+
+# stepper motor sequence (found in documentation http://www.4tronix.co.uk/arduino/Stepper-Motors.php)
+STEP_SEQUENCE = [
+    [1, 0, 0, 1],
+    [1, 0, 0, 0],
+    [1, 1, 0, 0],
+    [0, 1, 0, 0],
+    [0, 1, 1, 0],
+    [0, 0, 1, 0],
+    [0, 0, 1, 1],
+    [0, 0, 0, 1],
+]
+# STEP_SEQUENCE as bit masks, the first pin's level in the lowest bit
+STEP_MASKS = [
+    sum(level << pin for pin, level in enumerate(step)) for step in STEP_SEQUENCE
+]
+
+
+class Direction(Enum):
+    POSITIVE = 1
+    ZERO = 0
+    NEGATIVE = -1
+
+
+class Axis:
+    """
+    One stepper motor: its pins and their levels (as a mask, see
+    STEP_MASKS), where it is in STEP_SEQUENCE and the direction it last
+    moved in, for backlash. sequence_step is which way through the sequence
+    a positive step goes, the knobs turn opposite ways.
+    """
+
+    def __init__(self, gpio, pins: list[int], sequence_step: int):
+        self.gpio = gpio
+        self.pins = pins
+        self.sequence_step = sequence_step
+        self.sequence_index = 0
+        self.direction = Direction.ZERO
+        self.levels = 0
+
+    def setup(self):
+        for pin in self.pins:
+            self.gpio.setup(pin, self.gpio.OUT)
+        self.release()
+
+    def release(self):
+        for pin in self.pins:
+            self.gpio.output(pin, self.gpio.LOW)
+        self.levels = 0
+
+    def set_direction(self, direction: Direction) -> int:
+        """
+        Records the direction the axis is about to move in, returns the
+        backlash compensation steps it needs first because it reversed
+        """
+        backlash = 0
+        if (
+            self.direction != Direction.ZERO
+            and direction != Direction.ZERO
+            and self.direction != direction
+        ):
+            backlash = BACKLASH_COMPENSATION_STEPS
+
+        if direction != Direction.ZERO:
+            self.direction = direction
+
+        return backlash
+
+    def step(self, direction: Direction):
+        if direction == Direction.ZERO:
+            return
+
+        for pin, level in zip(self.pins, STEP_SEQUENCE[self.sequence_index]):
+            self.gpio.output(pin, level)
+        self.levels = STEP_MASKS[self.sequence_index]
+
+        self.sequence_index = (
+            self.sequence_index + direction.value * self.sequence_step
+        ) % 8
+
+
+class Plotter:
+    """
+    An Etch-a-Sketch: an x and a y axis on their own pins. Moves are
+    generators that step the motors for a tick and then yield how long to
+    wait before the next one, so whoever runs them keeps the time, and one
+    loop can run several plotters at once.
+    """
+
+    def __init__(self, gpio, x_pins: list[int], y_pins: list[int], name: str = ""):
+        self.gpio = gpio
+        self.name = name
+        self.x = Axis(gpio, x_pins, sequence_step=-1)
+        self.y = Axis(gpio, y_pins, sequence_step=1)
+
+    def setup(self):
+        self.x.setup()
+        self.y.setup()
+
+    def release(self):
+        self.x.release()
+        self.y.release()
+
+    def home(self) -> Iterator[float]:
+        """
+        Moves the pen to the top left
+        """
+        return self.motor_ticks(
+            5 * STEPS_PER_TURN, Direction.NEGATIVE, Direction.NEGATIVE
+        )
+
+    def command_ticks(
+        self, command: Command | Move, start_tick: int = 0
+    ) -> Iterator[float]:
+        if isinstance(command, Move):
+            return self.vector_ticks(command.dx, command.dy, start_tick)
+        return self.motor_ticks(
+            command.steps, Direction(command.x), Direction(command.y), start_tick
+        )
+
+    def motor_ticks(
+        self,
+        step_count: int,
+        x_dir: Direction,
+        y_dir: Direction,
+        start_tick: int = 0,
+    ) -> Iterator[float]:
+        """
+        Steps both axes step_count times, plus backlash compensation. Starting
+        from start_tick skips the ticks an interrupted run already did.
+        """
+        x_backlash = self.x.set_direction(x_dir)
+        y_backlash = self.y.set_direction(y_dir)
+        x_fuel = step_count + x_backlash
+        y_fuel = step_count + y_backlash
+
+        # Every move (or what's left of it) ramps up from and back down to
+        # STEP_SLEEP_SECS
+        ticks = max(x_fuel, y_fuel)
+        periods = trapezoid_periods(max(ticks - start_tick, 0))
+        tick = 0
+
+        while x_fuel > 0 or y_fuel > 0:
+            stepping = tick >= start_tick
+
+            if x_fuel >= y_fuel:
+                x_fuel -= 1
+                if stepping:
+                    self.x.step(x_dir)
+
+            if y_fuel >= x_fuel:
+                y_fuel -= 1
+                if stepping:
+                    self.y.step(y_dir)
+
+            if stepping:
+                yield periods[tick - start_tick]
+            tick += 1
+
+    def vector_ticks(self, dx: int, dy: int, start_tick: int = 0) -> Iterator[float]:
+        """
+        Moves dx steps along x and dy along y in a straight line, interleaving
+        the two axes Bresenham style. Backlash is taken up before the line
+        starts. Starting from start_tick skips the ticks an interrupted run
+        already did.
+        """
+        x_dir = Direction(sign(dx))
+        y_dir = Direction(sign(dy))
+        x_backlash = self.x.set_direction(x_dir)
+        y_backlash = self.y.set_direction(y_dir)
+
+        backlash_ticks = max(x_backlash, y_backlash)
+        line_ticks = max(abs(dx), abs(dy))
+        ticks = backlash_ticks + line_ticks
+        periods = trapezoid_periods(max(ticks - start_tick, 0))
+
+        for tick in range(start_tick, backlash_ticks):
+            if tick < x_backlash:
+                self.x.step(x_dir)
+            if tick < y_backlash:
+                self.y.step(y_dir)
+            yield periods[tick - start_tick]
+
+        # The long axis steps every tick, the short one whenever its error
+        # overflows
+        x_error = line_ticks // 2
+        y_error = line_ticks // 2
+        for tick in range(backlash_ticks, ticks):
+            stepping = tick >= start_tick
+
+            x_error += abs(dx)
+            if x_error >= line_ticks:
+                x_error -= line_ticks
+                if stepping:
+                    self.x.step(x_dir)
+
+            y_error += abs(dy)
+            if y_error >= line_ticks:
+                y_error -= line_ticks
+                if stepping:
+                    self.y.step(y_dir)
+
+            if stepping:
+                yield periods[tick - start_tick]
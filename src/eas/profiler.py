@@ -0,0 +1,132 @@
+import cProfile
+import json
+import time
+from collections import defaultdict
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from sys import argv
+
+
+class PhaseProfiler:
+    """
+    Opt in instrumentation for the planners: cumulative time, calls and
+    pixels touched per phase, and histograms of values like jump distances
+    and search sizes, bucketed by powers of two
+    """
+
+    def __init__(self):
+        self.secs: dict[str, float] = defaultdict(float)
+        self.calls: dict[str, int] = defaultdict(int)
+        self.pixels: dict[str, int] = defaultdict(int)
+        self.histograms: dict[str, dict[int, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.secs[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def touched(self, name: str, pixels: int):
+        self.pixels[name] += pixels
+
+    def observe(self, name: str, value: int):
+        """
+        Counts value in the histogram's bucket for the largest power of two
+        at most value, 0 for anything less than 1
+        """
+        value = int(value)
+        self.histograms[name][1 << (value.bit_length() - 1) if value > 0 else 0] += 1
+
+    def report(self) -> dict:
+        total = sum(self.secs.values())
+        return {
+            "total_secs": total,
+            "phases": {
+                name: {
+                    "secs": secs,
+                    "share": secs / total if total else 0.0,
+                    "calls": self.calls[name],
+                    "pixels": self.pixels.get(name, 0),
+                }
+                for name, secs in sorted(self.secs.items(), key=lambda item: -item[1])
+            },
+            "histograms": {
+                name: {str(bucket): count for bucket, count in sorted(buckets.items())}
+                for name, buckets in self.histograms.items()
+            },
+        }
+
+
+def phase(profiler: PhaseProfiler | None, name: str) -> AbstractContextManager:
+    """
+    profiler.phase(name), or nothing at all without a profiler
+    """
+    return nullcontext() if profiler is None else profiler.phase(name)
+
+
+def main():
+    args = argv[1:]
+    cprofile_path = None
+    if "--cprofile" in args:
+        i = args.index("--cprofile")
+        cprofile_path = args[i + 1] if i + 1 < len(args) else None
+        del args[i : i + 2]
+        if cprofile_path is None:
+            print("Nuh uh! --cprofile needs a file to write to")
+            return
+    usage = (
+        "Nuh uh! Supply an image, optionally a planner (toolpath, "
+        "toolpath_cost or image_path) and --cprofile out.prof"
+    )
+    if len(args) not in (1, 2):
+        print(usage)
+        return
+
+    import image
+    import image_path
+    import toolpath
+    from contextlib import redirect_stdout
+    from cost import CostModel
+    from io import StringIO
+
+    planners = {
+        "toolpath": lambda edges, profiler: toolpath.generate_toolpath(
+            edges, profiler=profiler
+        ),
+        "toolpath_cost": lambda edges, profiler: toolpath.generate_toolpath(
+            edges, CostModel(), profiler=profiler
+        ),
+        "image_path": lambda edges, profiler: image_path.generate_path(
+            edges, profiler=profiler
+        ),
+    }
+    name = args[1] if len(args) == 2 else "toolpath_cost"
+    if name not in planners:
+        print(usage)
+        return
+    planner = planners[name]
+
+    # The dump loads into pstats, snakeviz, flameprof and the like
+    profiler = PhaseProfiler()
+    cprofiler = cProfile.Profile() if cprofile_path is not None else None
+    if cprofiler is not None:
+        cprofiler.enable()
+
+    with redirect_stdout(StringIO()):
+        with profiler.phase("canny"):
+            edges = image.Preprocessor(image.screen_resolution()).edges(args[0])
+        planner(edges, profiler)
+
+    if cprofiler is not None:
+        cprofiler.disable()
+        cprofiler.dump_stats(cprofile_path)
+
+    print(json.dumps(profiler.report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import contextlib
+import io
+import numpy as np
+import os
+import sys
+from sys import argv
+import compiler
+from fleet import FLEET_PINS
+from gpio_backend import TRACE_FILE, RecordingGPIO
+from plotter import STEP_MASKS, Plotter
+from scheduler import MAX_LATENESS_SECS, FakeClock, StepScheduler
+from telemetry import Telemetry
+from toolfile import iter_commands
+
+# Writes closer together than this are part of the same step
+BURST_SECS = 0.0005
+HISTOGRAM_BINS = 12
+HISTOGRAM_WIDTH = 40
+
+# Pi like costs for recording on a virtual clock, as in scheduler.main
+SLEEP_OVERSHOOT_SECS = 0.00008
+OUTPUT_SECS = 0.000015
+
+
+def axis_steps(trace: np.ndarray, pins: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    When an axis stepped in a trace, and which way through STEP_SEQUENCE (0
+    for the first step after its pins were released). Neighbouring patterns
+    differ in one pin, so a step is one write that moves the pins onto a new
+    pattern of the sequence. Patterns passed through on the way to or from
+    released pins, writes within BURST_SECS of each other, don't count.
+    """
+    writes = trace[np.isin(trace["pin"], pins)]
+
+    # Each pin's level after every write, held from its last write
+    index = np.arange(len(writes))
+    levels = np.zeros(len(writes), int)
+    for bit, pin in enumerate(pins):
+        written = writes["pin"] == pin
+        last = np.maximum.accumulate(np.where(written, index, -1))
+        level = np.where(last >= 0, writes["level"][np.maximum(last, 0)], 0)
+        levels |= level.astype(int) << bit
+
+    previous = np.concatenate(([0], levels[:-1]))
+    changes = np.flatnonzero(levels != previous)
+    patterns = levels[changes]
+    times = writes["time"][changes]
+
+    positions = np.full(16, -1)
+    positions[STEP_MASKS] = np.arange(len(STEP_MASKS))
+    in_sequence = positions[patterns] >= 0
+    came_from = np.concatenate(([False], in_sequence[:-1]))
+    goes_to = np.concatenate((in_sequence[1:], [True]))
+    soon = np.diff(times, append=np.inf) < BURST_SECS
+    stepped = in_sequence & ~(soon & ~(came_from & goes_to))
+
+    step_positions = positions[patterns[stepped]]
+    moves = (np.diff(step_positions, prepend=0) + 4) % 8 - 4
+    # Steps since the pins were last released have nothing to go from
+    releases = np.cumsum(~in_sequence)[stepped]
+    moves[np.diff(releases, prepend=-1) != 0] = 0
+
+    return times[stepped], moves
+
+
+def expected_trace(
+    commands: list, home: bool = False, pins: tuple = FLEET_PINS[0]
+) -> np.ndarray:
+    """
+    The trace the commands should give, from the driver on a virtual clock
+    where writes and sleeps take no time at all
+    """
+    clock = FakeClock()
+    gpio = RecordingGPIO(clock)
+    plotter = Plotter(gpio, *pins)
+    scheduler = StepScheduler(clock)
+
+    if home:
+        for period in plotter.home():
+            scheduler.wait(period)
+
+    compiled = compiler.compile_commands(plotter, commands)
+    for index in range(len(commands)):
+        for period in compiler.command_ticks(plotter, compiled, index):
+            scheduler.wait(period)
+
+    return gpio.trace()
+
+
+def record(
+    commands_file: str, path: str = TRACE_FILE, home: bool = False
+) -> np.ndarray:
+    """
+    Records main drawing the commands on a virtual clock, with writes and
+    sleeps costing about what they do on a Pi
+    """
+    os.environ["EAS_GPIO"] = "fake"
+    import main as driver
+
+    clock = FakeClock(sleep_overshoot_secs=SLEEP_OVERSHOOT_SECS)
+    driver.GPIO = RecordingGPIO(clock, output_secs=OUTPUT_SECS)
+    driver.plotter = Plotter(driver.GPIO, driver.X_MOTOR_PINS, driver.Y_MOTOR_PINS)
+    driver.scheduler = StepScheduler(clock)
+    driver.telemetry = Telemetry(driver.scheduler)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if home:
+            driver.reset_pen()
+        driver.draw_from_file(iter_commands(commands_file))
+
+    driver.GPIO.save(path)
+    return driver.GPIO.trace()
+
+
+def compare_axis(trace: np.ndarray, expected: np.ndarray, pins: list[int]) -> dict:
+    """
+    Checks an axis stepped the way it should have, and how its timing
+    differed. Step times are lined up on the first step.
+    """
+    times, moves = axis_steps(trace, pins)
+    expected_times, expected_moves = axis_steps(expected, pins)
+
+    result = {
+        "steps": len(times),
+        "expected_steps": len(expected_times),
+        "matches": bool(
+            len(moves) == len(expected_moves) and np.array_equal(moves, expected_moves)
+        ),
+    }
+    if not result["matches"] or len(times) < 2:
+        return result
+
+    intervals = np.diff(times)
+    expected_intervals = np.diff(expected_times)
+    jitter = intervals - expected_intervals
+    lateness = (times - times[0]) - (expected_times - expected_times[0])
+
+    result.update(
+        {
+            "intervals": intervals,
+            "jitter": jitter,
+            "stalls": jitter[jitter > MAX_LATENESS_SECS],
+            "duration_secs": times[-1] - times[0],
+            "expected_secs": expected_times[-1] - expected_times[0],
+            "max_lateness_secs": float(lateness.max()),
+        }
+    )
+    return result
+
+
+def histogram(values: np.ndarray, unit: float, label: str) -> list[str]:
+    if len(values) == 0:
+        return [f"  no {label}"]
+
+    counts, edges = np.histogram(values / unit, bins=HISTOGRAM_BINS)
+    lines = []
+    for count, low, high in zip(counts, edges, edges[1:]):
+        bar = "#" * int(np.ceil(count / counts.max() * HISTOGRAM_WIDTH))
+        lines.append(f"  {low:9.1f} - {high:9.1f} {label} | {bar} {count}")
+    return lines
+
+
+def report(trace: np.ndarray, commands: list, home: bool = False) -> bool:
+    """
+    Prints step rate, jitter and stall histograms for each axis of a trace,
+    checked against the commands. Returns whether every axis matched.
+    """
+    expected = expected_trace(commands, home)
+    matched = True
+
+    for name, pins in zip("xy", FLEET_PINS[0]):
+        result = compare_axis(trace, expected, pins)
+        print(
+            f"{name}: {result['steps']} steps, expected {result['expected_steps']}, "
+            f"{'matches' if result['matches'] else 'DOES NOT MATCH'} the commands"
+        )
+        matched &= result["matches"]
+        if "intervals" not in result:
+            continue
+
+        print(
+            f"  took {result['duration_secs']:.1f} s against "
+            f"{result['expected_secs']:.1f} s, "
+            f"max lateness {result['max_lateness_secs'] * 1000:.1f} ms, "
+            f"{len(result['stalls'])} stalls"
+        )
+        print("  Step rate:")
+        print("\n".join(histogram(1 / result["intervals"], 1, "steps/s")))
+        print("  Jitter:")
+        print("\n".join(histogram(result["jitter"], 1e-6, "us")))
+        print("  Stalls:")
+        print("\n".join(histogram(result["stalls"], 1e-3, "ms")))
+
+    return matched
+
+
+def main():
+    args = argv[1:]
+    home = "--home" in args
+    if home:
+        args.remove("--home")
+
+    if len(args) in (2, 3) and args[0] == "record":
+        path = args[2] if len(args) == 3 else TRACE_FILE
+        trace = record(args[1], path, home)
+        print(f"Recorded {len(trace)} writes to {path}")
+        sys.exit(0 if report(trace, list(iter_commands(args[1])), home) else 1)
+
+    if len(args) != 2:
+        print(
+            "Nuh uh! Supply a trace and the command file it drew (and --home if "
+            "it homed first), or record commands_file [trace]"
+        )
+        return
+
+    trace = np.load(args[0])
+    sys.exit(0 if report(trace, list(iter_commands(args[1])), home) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import math
+import os
+import time
+import numpy as np
+from sys import argv
+from constants import ACCEL_TICKS, MIN_STEP_SLEEP_SECS, STEP_SLEEP_SECS
+
+MAX_LATENESS_SECS = 0.01  # after a stall this late, stop trying to catch up
+SPIN_SECS = 0.0002  # busy wait the end of every sleep, time.sleep overshoots
+
+
+class MonotonicClock:
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep_until(self, deadline: float):
+        remaining = deadline - time.monotonic() - SPIN_SECS
+        if remaining > 0:
+            time.sleep(remaining)
+        while time.monotonic() < deadline:
+            pass
+
+
+class FakeClock:
+    """
+    Clock that only moves when told to. Every sleep overshoots by
+    sleep_overshoot_secs, like time.sleep does.
+    """
+
+    def __init__(self, sleep_overshoot_secs: float = 0.0):
+        self.time = 0.0
+        self.sleep_overshoot_secs = sleep_overshoot_secs
+
+    def now(self) -> float:
+        return self.time
+
+    def advance(self, secs: float):
+        self.time += secs
+
+    def sleep_until(self, deadline: float):
+        if deadline > self.time:
+            self.time = deadline + self.sleep_overshoot_secs
+
+
+def trapezoid_periods(
+    ticks: int,
+    start_period: float = STEP_SLEEP_SECS,
+    min_period: float = MIN_STEP_SLEEP_SECS,
+    accel_ticks: int = ACCEL_TICKS,
+) -> np.ndarray:
+    """
+    Tick periods for a move: the step rate ramps linearly from 1 / start_period
+    up to 1 / min_period over accel_ticks, cruises, and ramps back down for the
+    last accel_ticks. Moves too short to reach cruise speed get a triangle.
+    """
+    tick = np.arange(ticks)
+    ramp = np.minimum(np.minimum(tick, ticks - 1 - tick), accel_ticks)
+    ramp = ramp / max(accel_ticks, 1)
+
+    start_rate = 1 / start_period
+    max_rate = 1 / min_period
+    return 1 / (start_rate + (max_rate - start_rate) * ramp)
+
+
+class StepScheduler:
+    """
+    Waits for ticks against absolute deadlines on a monotonic clock, so time
+    spent on GPIO calls and sleep overshoot doesn't add up over a move.
+    Keeps statistics on how late each tick was.
+    """
+
+    def __init__(self, clock=None, max_lateness: float = MAX_LATENESS_SECS):
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.max_lateness = max_lateness
+        self.deadline = None
+        self.ticks = 0
+        self.start_time = None
+        self.lateness_sum = 0.0
+        self.lateness_sq_sum = 0.0
+        self.max_seen_lateness = 0.0
+        self.resyncs = 0
+
+    def wait(self, period: float):
+        """
+        Waits until period after the previous tick's deadline
+        """
+        self.clock.sleep_until(self.schedule(period))
+        self.settle()
+
+    def schedule(self, period: float) -> float:
+        """
+        Sets the next tick's deadline period after the previous one, for when
+        something else does the sleeping, and returns it
+        """
+        if self.deadline is None:
+            self.deadline = self.clock.now()
+            self.start_time = self.deadline
+
+        self.deadline += period
+        return self.deadline
+
+    def settle(self):
+        """
+        Records how late the tick was once its deadline has passed
+        """
+        lateness = self.clock.now() - self.deadline
+        self.ticks += 1
+        self.lateness_sum += lateness
+        self.lateness_sq_sum += lateness * lateness
+        self.max_seen_lateness = max(self.max_seen_lateness, lateness)
+
+        # A stall (or a pause between jobs) shouldn't be followed by a burst
+        if lateness > self.max_lateness:
+            self.deadline = self.clock.now()
+            self.resyncs += 1
+
+    def stats(self) -> dict:
+        if self.ticks == 0:
+            return {"ticks": 0}
+
+        elapsed = self.clock.now() - self.start_time
+        mean = self.lateness_sum / self.ticks
+        variance = max(self.lateness_sq_sum / self.ticks - mean * mean, 0.0)
+        return {
+            "ticks": self.ticks,
+            "elapsed_secs": elapsed,
+            "step_rate": self.ticks / elapsed if elapsed > 0 else math.inf,
+            "mean_lateness_secs": mean,
+            "jitter_secs": math.sqrt(variance),
+            "max_lateness_secs": self.max_seen_lateness,
+            "resyncs": self.resyncs,
+        }
+
+
+def main():
+    if len(argv) != 2:
+        print("Nuh uh! Supply a single argument please")
+        return
+
+    # Runs a plotter against a fake clock, with GPIO calls and sleeps that
+    # take about as long as they do on a Pi
+    os.environ["EAS_GPIO"] = "fake"
+    import gpio_backend
+    from main import X_MOTOR_PINS, Y_MOTOR_PINS
+    from plotter import Plotter
+    from toolfile import iter_commands
+
+    clock = FakeClock(sleep_overshoot_secs=0.00008)
+    gpio = gpio_backend.FakeGPIO(clock, output_secs=0.000015)
+    plotter = Plotter(gpio, X_MOTOR_PINS, Y_MOTOR_PINS)
+    scheduler = StepScheduler(clock)
+
+    for command in iter_commands(argv[1]):
+        for period in plotter.command_ticks(command):
+            scheduler.wait(period)
+
+    stats = scheduler.stats()
+    print(
+        f"Ticks: {stats['ticks']}, drawing time: {stats['elapsed_secs'] / 60:.1f} min"
+    )
+    print(f"Step rate: {stats['step_rate']:.0f} ticks/s")
+    print(
+        f"Jitter: {stats['jitter_secs'] * 1e6:.0f} us, "
+        f"max lateness: {stats['max_lateness_secs'] * 1e6:.0f} us"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from sys import argv
+from urllib.parse import parse_qs, urlsplit
+import chains
+import euler
+import image
+import simulate
+import toolpath
+from cache import ToolpathCache, plan_key
+from cost import CostModel
+from pipeline import JOBS_DIR, STREAM_PLANNERS
+from telemetry import PROMETHEUS_CONTENT_TYPE
+from toolfile import MAGIC, iter_commands, load_commands, save_toolfile
+
+HOST = "0.0.0.0"
+PORT = 8080
+PLANNING_WORKERS = max((os.cpu_count() or 2) - 1, 1)  # leaves a core for the device
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+PLANNERS = {
+    "toolpath": toolpath,
+    "chains": chains,
+    "euler": euler,
+}
+
+# Fits uploads to the screen's shape rather than squashing them
+PREPROCESSOR = image.Preprocessor(image.screen_resolution())
+COST_MODEL = CostModel()
+
+STATUS_TEXT = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    500: "Internal Server Error",
+}
+
+
+@dataclass
+class Job:
+    """
+    A drawing job. Goes queued -> planning -> ready -> drawing -> done, or
+    failed. Command files skip straight through planning, and streamed
+    images are planned while they're drawn, so their stats only come in once
+    they're done.
+    """
+
+    id: int
+    name: str
+    planner: str
+    submitted: float
+    status: str = "queued"
+    path: str | None = None
+    commands: int = 0
+    ticks: int = 0
+    draw_secs: float = 0.0
+    ticks_done: int = 0
+    started: float | None = None
+    finished: float | None = None
+    error: str | None = None
+    cached: bool = False
+    stream: bool = False
+
+    def remaining_secs(self) -> float:
+        if self.ticks == 0:
+            return 0.0
+        return self.draw_secs * max(1 - self.ticks_done / self.ticks, 0.0)
+
+
+def job_stats(path: str) -> dict:
+    commands = load_commands(path)
+    ticks = simulate.command_ticks(commands)
+    return {
+        "commands": len(commands),
+        "ticks": int(ticks.sum()),
+        "draw_secs": simulate.draw_secs(ticks),
+    }
+
+
+def plan_image(data: bytes, planner: str, path: str) -> dict:
+    """
+    Runs in a planning worker: finds the edges of an uploaded image, plans a
+    toolpath and saves it as a packed command file
+    """
+    edges = PREPROCESSOR.edges(data)
+    commands = PLANNERS[planner].generate_toolpath(edges, COST_MODEL)
+    height, width = edges.shape
+    save_toolfile(path, commands, width, height)
+
+    return job_stats(path)
+
+
+def write_file(path: str, data: bytes):
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def store_commands(data: bytes, path: str) -> dict:
+    """
+    Runs in a planning worker: saves an uploaded command file as it is
+    """
+    write_file(path, data)
+    return job_stats(path)
+
+
+def is_command_file(data: bytes) -> bool:
+    return data.startswith(MAGIC) or data.lstrip().startswith(b"{")
+
+
+class Device(threading.Thread):
+    """
+    Draws ready jobs one after the other, in the order they finished
+    planning. The driver in main keeps its motor state in module globals, so
+    this is the only thread that touches it.
+    """
+
+    def __init__(self, driver):
+        super().__init__(daemon=True)
+        self.driver = driver
+        self.ready: queue.Queue[Job | None] = queue.Queue()
+        self.current: Job | None = None
+        self.start_ticks = 0
+        # Saved images of streamed jobs, by job id, planned once they're drawn
+        self.sources: dict[int, str] = {}
+
+    def ticks_done(self) -> int:
+        """
+        Ticks drawn of the current job so far, homing aside
+        """
+        if self.current is None or self.current.started is None:
+            return 0
+        return max(self.driver.scheduler.ticks - self.start_ticks, 0)
+
+    def run(self):
+        from checkpoint import Checkpoint, Checkpointer
+
+        while True:
+            job = self.ready.get()
+            if job is None:
+                return
+
+            self.current = job
+            job.status = "drawing"
+            try:
+                # A crash mid job can be picked up with main.py --resume
+                self.driver.job = Checkpoint(file=job.path)
+                source = self.sources.pop(job.id, None)
+                if source is not None:
+                    # Plans while the pen homes
+                    commands = self.driver.stream_commands(
+                        source, job.planner, PREPROCESSOR.params()
+                    )
+                else:
+                    commands = iter_commands(job.path)
+
+                self.driver.reset_pen()
+                job.started = time.time()
+
+                self.driver.checkpointer = Checkpointer()
+                self.start_ticks = self.driver.scheduler.ticks
+                if source is not None:
+                    self.driver.telemetry.start_job(job.path)
+                else:
+                    # After homing, which leaves the axes' directions set
+                    self.driver.start_job(job.path)
+                    job.ticks = self.driver.telemetry.total_ticks
+                    job.draw_secs = self.driver.telemetry.total_planned_secs
+                self.driver.draw_from_file(commands)
+                self.driver.checkpointer.clear()
+                self.driver.telemetry.finish_job()
+
+                if source is not None:
+                    stats = job_stats(job.path)
+                    job.commands = stats["commands"]
+                    job.ticks = stats["ticks"]
+                    job.draw_secs = stats["draw_secs"]
+                job.ticks_done = job.ticks
+                job.status = "done"
+            except Exception as error:
+                # Anything from planning, the file or the GPIO fails this job,
+                # the device carries on with the next
+                logging.exception("Job %d failed while drawing", job.id)
+                job.status = "failed"
+                job.error = str(error)
+            finally:
+                job.finished = time.time()
+                self.current = None
+
+
+class JobService:
+    def __init__(self, driver, jobs_dir: str = JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+
+        self.jobs: dict[int, Job] = {}
+        self.ids = itertools.count(1)
+        self.device = Device(driver)
+        # Spawned rather than forked, the device thread is already running
+        self.pool = ProcessPoolExecutor(
+            PLANNING_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.planning_slots = asyncio.Semaphore(PLANNING_WORKERS)
+        self.tasks: set[asyncio.Task] = set()
+        self.cache = ToolpathCache()
+
+    def submit(self, data: bytes, name: str, planner: str, stream: bool = False) -> Job:
+        planners = STREAM_PLANNERS if stream else PLANNERS
+        if planner not in planners:
+            raise ValueError(
+                f"Unknown planner {planner}, expected one of {list(planners)}"
+            )
+
+        job = Job(
+            id=next(self.ids),
+            name=name,
+            planner=planner,
+            submitted=time.time(),
+            stream=stream,
+        )
+        # Streamed commands are written one at a time, as they're drawn
+        job.path = os.path.join(
+            self.jobs_dir, f"{job.id}.{'jsonl' if stream else 'eas'}"
+        )
+        self.jobs[job.id] = job
+        # The loop only keeps weak references to tasks
+        task = asyncio.create_task(self.plan(job, data))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+        return job
+
+    async def plan(self, job: Job, data: bytes):
+        loop = asyncio.get_running_loop()
+        if job.stream and not is_command_file(data):
+            # Kept on disk, so an interrupted job can be planned again
+            source = os.path.join(self.jobs_dir, f"{job.id}.source")
+            await loop.run_in_executor(None, write_file, source, data)
+            self.device.sources[job.id] = source
+            job.status = "ready"
+            self.device.ready.put(job)
+            return
+
+        try:
+            if is_command_file(data):
+                stats = await self.run_planning(job, store_commands, data, job.path)
+            else:
+                key = plan_key(
+                    data,
+                    job.planner,
+                    PLANNERS[job.planner].PLANNER_VERSION,
+                    PREPROCESSOR.params(),
+                    asdict(COST_MODEL),
+                )
+                # Copying files and evicting would hold up every other request
+                if await loop.run_in_executor(None, self.cache.get, key, job.path):
+                    # Doesn't wait for a planning worker, so it's ready to draw
+                    # straight away
+                    job.cached = True
+                    stats = await loop.run_in_executor(None, job_stats, job.path)
+                else:
+                    stats = await self.run_planning(
+                        job, plan_image, data, job.planner, job.path
+                    )
+                    await loop.run_in_executor(None, self.cache.put, key, job.path)
+        except Exception as error:
+            # Decoding and planning can fail in many ways, none of them should
+            # leave the job planning forever
+            logging.exception("Job %d failed while planning", job.id)
+            job.status = "failed"
+            job.error = str(error)
+            job.finished = time.time()
+            return
+
+        job.commands = stats["commands"]
+        job.ticks = stats["ticks"]
+        job.draw_secs = stats["draw_secs"]
+        job.status = "ready"
+        self.device.ready.put(job)
+
+    async def run_planning(self, job: Job, function, *args) -> dict:
+        loop = asyncio.get_running_loop()
+        async with self.planning_slots:
+            job.status = "planning"
+            return await loop.run_in_executor(self.pool, function, *args)
+
+    def job_info(self, job: Job, eta_secs: float | None) -> dict:
+        return {**asdict(job), "eta_secs": eta_secs}
+
+    def job_list(self) -> list[dict]:
+        """
+        Every job with how long until it's finished drawing, for ready jobs
+        that's after everything ahead of them. Jobs still planning have no ETA.
+        """
+        current = self.device.current
+        ahead = 0.0
+        etas = {}
+        if current is not None:
+            current.ticks_done = min(self.device.ticks_done(), current.ticks)
+            ahead = current.remaining_secs()
+            # Once it's drawing, from the steps left and how timing's going
+            eta = self.device.driver.telemetry.eta_secs()
+            if current.started is not None and eta is not None:
+                ahead = eta
+            etas[current.id] = ahead
+        for job in list(self.device.ready.queue):
+            if job is not None:
+                ahead += job.remaining_secs()
+                etas[job.id] = ahead
+
+        return [self.job_info(job, etas.get(job.id)) for job in self.jobs.values()]
+
+    def status(self) -> dict:
+        jobs = self.job_list()
+        current = self.device.current
+        counts = {}
+        for job in jobs:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+
+        return {
+            "device": "drawing" if current is not None else "idle",
+            "current_job": current.id if current is not None else None,
+            "queue_depth": counts.get("queued", 0)
+            + counts.get("planning", 0)
+            + counts.get("ready", 0),
+            "jobs": counts,
+            "eta_secs": max(
+                (job["eta_secs"] for job in jobs if job["eta_secs"] is not None),
+                default=0.0,
+            ),
+            "cache": self.cache.stats(),
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            code, body = await self.route(reader)
+        except (ValueError, asyncio.IncompleteReadError) as error:
+            code, body = 400, {"error": str(error)}
+        except Exception as error:
+            # The catch all, so every request gets a response
+            logging.exception("Request failed")
+            code, body = 500, {"error": f"{type(error).__name__}: {error}"}
+
+        if isinstance(body, str):
+            payload, content_type = body.encode(), PROMETHEUS_CONTENT_TYPE
+        else:
+            payload, content_type = json.dumps(body).encode(), "application/json"
+        writer.write(
+            f"HTTP/1.1 {code} {STATUS_TEXT[code]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode()
+            + payload
+        )
+        await writer.drain()
+        writer.close()
+
+    async def route(self, reader: asyncio.StreamReader) -> tuple[int, dict | str]:
+        request_line = (await reader.readline()).decode().split()
+        if len(request_line) != 3:
+            raise ValueError("malformed request line")
+        method, target, _ = request_line
+
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_BYTES:
+            raise ValueError(f"body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length)
+
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+
+        match method, parts:
+            case "POST", ["jobs"]:
+                if not body:
+                    raise ValueError("upload an image or command file")
+                job = self.submit(
+                    body,
+                    query.get("name", ""),
+                    query.get("planner", "toolpath"),
+                    query.get("stream", "") in ("1", "true"),
+                )
+                return 202, self.job_info(job, None)
+            case "GET", ["jobs"]:
+                return 200, {"jobs": self.job_list()}
+            case "GET", ["jobs", job_id] if job_id.isdigit():
+                for info in self.job_list():
+                    if info["id"] == int(job_id):
+                        return 200, info
+            case "GET", ["status"]:
+                return 200, self.status()
+            case "GET", ["metrics"]:
+                return 200, self.device.driver.telemetry.metrics()
+
+        return 404, {"error": f"no route for {method} {url.path}"}
+
+
+async def serve(driver, host: str = HOST, port: int = PORT):
+    service = JobService(driver)
+    service.device.start()
+
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving on {host}:{port}, planning with {PLANNING_WORKERS} workers")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    args = argv[1:]
+    if "--fake" in args:
+        # Draws on the fake GPIO backend, in real time, for running off a Pi
+        os.environ["EAS_GPIO"] = "fake"
+        args.remove("--fake")
+    if len(args) > 1:
+        print("Nuh uh! Supply at most a port (and --fake) please")
+        return
+
+    import main as driver
+
+    driver.setup_gpio()
+    try:
+        asyncio.run(serve(driver, port=int(args[0]) if args else PORT))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        driver.cleanup_gpio()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import cv2 as cv
+import numpy as np
+from sys import argv
+from command import START_OFFSET_STEPS, Command, Move, delta, direction, length
+from constants import BACKLASH_COMPENSATION_STEPS, STEP_SLEEP_SECS, STEPS_PER_PIXEL
+from cost import axis_reversals, reversals
+from scheduler import trapezoid_periods
+
+BACKGROUND_COLOUR = (255, 255, 255)
+DRAWN_COLOUR = (0, 0, 0)
+MISSED_COLOUR = (0, 0, 255)  # edge pixels the pen never went over
+
+
+def pen_steps(commands: list[Command | Move]) -> np.ndarray:
+    """
+    Pen position (x, y) after every tick that moves it, in steps from where it
+    started. Backlash ticks don't move the pen so they aren't in here, and
+    Moves step the way spin_vector's error accumulators step them.
+    """
+    deltas = np.array([delta(com) for com in commands], np.int64).reshape(-1, 2)
+    ticks = np.abs(deltas).max(axis=1, initial=0)
+    starts = np.cumsum(deltas, axis=0) - deltas
+
+    moving = ticks > 0
+    deltas, ticks, starts = deltas[moving], ticks[moving], starts[moving]
+
+    # Tick number within each command, 1 to ticks
+    first = np.cumsum(ticks) - ticks
+    tick = np.arange(1, ticks.sum() + 1) - np.repeat(first, ticks)
+
+    # An axis has taken (ticks // 2 + tick * |d|) // ticks steps by then, which
+    # for a Command is one per tick
+    per_tick = np.repeat(ticks, ticks)
+    deltas = np.repeat(deltas, ticks, axis=0)
+    steps = (per_tick // 2 + tick * np.abs(deltas).T) // per_tick
+
+    return np.repeat(starts, ticks, axis=0) + (np.sign(deltas).T * steps).T
+
+
+def backlash(commands: list[Command | Move]) -> np.ndarray:
+    """
+    Backlash compensation steps (x, y) spin_motor / spin_vector add before
+    each command
+    """
+    result = np.zeros((len(commands), 2), np.int64)
+    state = (0, 0)
+    for i, com in enumerate(commands):
+        prev_x, prev_y = state
+        _, state = axis_reversals(state, *direction(com))
+        result[i] = (
+            BACKLASH_COMPENSATION_STEPS * (prev_x != 0 and prev_x != state[0]),
+            BACKLASH_COMPENSATION_STEPS * (prev_y != 0 and prev_y != state[1]),
+        )
+
+    return result
+
+
+def command_ticks(commands: list[Command | Move]) -> np.ndarray:
+    """
+    Ticks the driver spends on each command, backlash included
+    """
+    lengths = np.array([length(com) for com in commands], np.int64)
+    return lengths + backlash(commands).max(axis=1, initial=0)
+
+
+def draw_secs(ticks: np.ndarray) -> float:
+    """
+    Time the driver takes over moves of the given tick counts, each one
+    ramping up from and back down to STEP_SLEEP_SECS
+    """
+    secs = 0.0
+    for count, repeats in zip(*np.unique(ticks, return_counts=True)):
+        secs += trapezoid_periods(int(count)).sum() * repeats
+
+    return float(secs)
+
+
+def rasterise(
+    positions: np.ndarray,
+    shape: tuple[int, int],
+    steps_per_pixel: int = 1,
+    origin: tuple[int, int] = (0, 0),
+) -> tuple[np.ndarray, int]:
+    """
+    Counts how many times the pen passes over each pixel, a pen sitting on a
+    pixel for several steps passes it once. origin is the step position of
+    pixel (0, 0). Returns the counts and the number of steps off the canvas.
+    """
+    height, width = shape
+    pixels = (positions - origin + steps_per_pixel // 2) // steps_per_pixel
+    xs, ys = pixels[:, 0], pixels[:, 1]
+
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    flat = ys[inside] * width + xs[inside]
+    entered = np.ones(len(flat), bool)
+    entered[1:] = flat[1:] != flat[:-1]
+
+    passes = np.bincount(flat[entered], minlength=height * width)
+    return passes.reshape(shape), int(np.count_nonzero(~inside))
+
+
+def simulate(
+    commands: list[Command | Move],
+    edges: np.ndarray,
+    steps_per_pixel: int = 1,
+    origin: tuple[int, int] = (0, 0),
+) -> tuple[dict, np.ndarray]:
+    """
+    Runs commands the way main does, without a device, and scores the drawing
+    against the edge map it was planned from. Pass STEPS_PER_PIXEL and the
+    start offset as origin for command files. Returns the stats and the
+    number of passes over each pixel.
+    """
+    commands = list(commands)
+    positions = pen_steps(commands)
+    passes, off_canvas = rasterise(positions, edges.shape, steps_per_pixel, origin)
+
+    backlash_steps = backlash(commands)
+    ticks = command_ticks(commands)
+    moved = np.abs(np.array([delta(com) for com in commands], np.int64)).reshape(-1, 2)
+    axis_steps = moved.sum(axis=0) + backlash_steps.sum(axis=0)
+
+    edge = edges == 255
+    drawn = passes > 0
+    edge_count = int(np.count_nonzero(edge))
+    covered = int(np.count_nonzero(edge & drawn))
+
+    stats = {
+        "commands": len(commands),
+        "x_steps": int(axis_steps[0]),
+        "y_steps": int(axis_steps[1]),
+        "reversals": reversals(commands),
+        "ticks": int(ticks.sum()),
+        "draw_secs": draw_secs(ticks),
+        "unramped_draw_secs": int(ticks.sum()) * STEP_SLEEP_SECS,
+        "edge_pixels": edge_count,
+        "covered_pixels": covered,
+        "coverage": covered / edge_count if edge_count else 1.0,
+        "stray_pixels": int(np.count_nonzero(drawn & ~edge)),
+        "overdrawn_passes": int(np.maximum(passes - 1, 0).sum()),
+        "off_canvas_steps": off_canvas,
+    }
+    return stats, passes
+
+
+def render(passes: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Drawing as a BGR image, with missed edge pixels highlighted
+    """
+    canvas = np.full((*passes.shape, 3), BACKGROUND_COLOUR, np.uint8)
+    canvas[(edges == 255) & (passes == 0)] = MISSED_COLOUR
+    canvas[passes > 0] = DRAWN_COLOUR
+    return canvas
+
+
+def main():
+    if len(argv) not in (3, 4):
+        print("Nuh uh! Supply a command file, its image and optionally a PNG")
+        return
+
+    import image
+    from toolfile import is_toolfile, iter_commands, read_header
+
+    steps_per_pixel = STEPS_PER_PIXEL
+    if is_toolfile(argv[1]):
+        steps_per_pixel = read_header(argv[1])["steps_per_pixel"]
+
+    edges = image.canny(argv[2])
+    stats, passes = simulate(
+        iter_commands(argv[1]),
+        edges,
+        steps_per_pixel,
+        (START_OFFSET_STEPS, START_OFFSET_STEPS),
+    )
+
+    if len(argv) == 4:
+        cv.imwrite(argv[3], render(passes, edges))
+
+    print(
+        f"Coverage: {stats['coverage']:.1%} of {stats['edge_pixels']} edge pixels, "
+        f"{stats['stray_pixels']} stray, {stats['overdrawn_passes']} passes overdrawn"
+    )
+    print(
+        f"Steps: x {stats['x_steps']}, y {stats['y_steps']}, "
+        f"{stats['reversals']} reversals"
+    )
+    print(
+        f"Drawing time: {stats['draw_secs'] / 60:.1f} min "
+        f"({stats['unramped_draw_secs'] / 60:.1f} min without ramps)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sys import argv
+from command import Command, Move, delta, direction
+from constants import BACKLASH_COMPENSATION_STEPS
+
+TELEMETRY_LOG = "eas_telemetry.jsonl"
+LOG_SECS = 5.0  # how often a running job logs its progress
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def backlash_steps(
+    directions: tuple[int, int], command: Command | Move
+) -> tuple[int, int]:
+    """
+    Backlash compensation steps (x, y) the command takes, given the axis
+    directions from before it
+    """
+    return tuple(
+        BACKLASH_COMPENSATION_STEPS * (before != 0 and after != 0 and before != after)
+        for before, after in zip(directions, direction(command))
+    )
+
+
+class Telemetry:
+    """
+    Progress of the job being drawn: commands, steps and backlash steps per
+    axis, and the ticks done with how long they were planned to take against
+    how long they took on the scheduler's clock. Given the job's totals, the
+    ETA is the planned time of the ticks left, scaled by how far timing has
+    slipped so far. With a log_path, progress is logged there as JSON lines
+    every log_secs.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        log_path: str | None = None,
+        log_secs: float = LOG_SECS,
+    ):
+        self.scheduler = scheduler
+        self.log_path = log_path
+        self.log_secs = log_secs
+        self.start_job("")
+
+    def start_job(
+        self,
+        name: str,
+        commands: int | None = None,
+        ticks: int | None = None,
+        planned_secs: float | None = None,
+    ):
+        """
+        Starts counting a job, with its totals when they're known
+        """
+        self.name = name
+        self.total_commands = commands
+        self.total_ticks = ticks
+        self.total_planned_secs = planned_secs
+        self.commands_done = 0
+        self.ticks_done = 0
+        self.steps = [0, 0]
+        self.backlash_steps = [0, 0]
+        self.planned_secs = 0.0
+        self.started = self.scheduler.clock.now()
+        self.drawing_secs = 0.0
+        self.last_log = self.started
+        if name:
+            self.log("start")
+
+    def command_done(
+        self,
+        command: Command | Move,
+        directions: tuple[int, int],
+        ticks: int,
+        planned_secs: float,
+    ):
+        """
+        Counts a drawn command that took ticks planned to last planned_secs,
+        directions being the axis directions from before it
+        """
+        self.commands_done += 1
+        self.ticks_done += ticks
+        self.planned_secs += planned_secs
+        for axis, (moved, backlash) in enumerate(
+            zip(delta(command), backlash_steps(directions, command))
+        ):
+            self.steps[axis] += abs(moved)
+            self.backlash_steps[axis] += backlash
+
+        now = self.scheduler.clock.now()
+        self.drawing_secs = now - self.started
+        if now - self.last_log >= self.log_secs:
+            self.log("progress")
+
+    def finish_job(self):
+        self.log("done")
+
+    def slip(self) -> float:
+        """
+        How long drawing took for every second it was planned to take
+        """
+        if self.planned_secs == 0:
+            return 1.0
+        return self.drawing_secs / self.planned_secs
+
+    def progress(self) -> float | None:
+        if not self.total_ticks:
+            return None
+        return min(self.ticks_done / self.total_ticks, 1.0)
+
+    def eta_secs(self) -> float | None:
+        if self.total_planned_secs is None:
+            return None
+        return max(self.total_planned_secs - self.planned_secs, 0.0) * self.slip()
+
+    def snapshot(self) -> dict:
+        return {
+            "job": self.name,
+            "commands_done": self.commands_done,
+            "commands": self.total_commands,
+            "ticks_done": self.ticks_done,
+            "ticks": self.total_ticks,
+            "x_steps": self.steps[0],
+            "y_steps": self.steps[1],
+            "x_backlash_steps": self.backlash_steps[0],
+            "y_backlash_steps": self.backlash_steps[1],
+            "planned_secs": self.planned_secs,
+            "drawing_secs": self.drawing_secs,
+            "slip": self.slip(),
+            "progress": self.progress(),
+            "eta_secs": self.eta_secs(),
+        }
+
+    def log(self, event: str):
+        self.last_log = self.scheduler.clock.now()
+        if self.log_path is None:
+            return
+
+        with open(self.log_path, "a") as file:
+            file.write(f"{json.dumps({'event': event, **self.snapshot()})}\n")
+
+    def metrics(self) -> str:
+        """
+        The counters and the scheduler's timing stats in Prometheus text format
+        """
+        timing = self.scheduler.stats()
+        metrics = [
+            (
+                "eas_commands_done_total",
+                "counter",
+                "Commands drawn",
+                [("", self.commands_done)],
+            ),
+            ("eas_ticks_done_total", "counter", "Ticks drawn", [("", self.ticks_done)]),
+            (
+                "eas_steps_total",
+                "counter",
+                "Steps drawn per axis, backlash aside",
+                [('axis="x"', self.steps[0]), ('axis="y"', self.steps[1])],
+            ),
+            (
+                "eas_backlash_steps_total",
+                "counter",
+                "Backlash compensation steps per axis",
+                [
+                    ('axis="x"', self.backlash_steps[0]),
+                    ('axis="y"', self.backlash_steps[1]),
+                ],
+            ),
+            (
+                "eas_planned_seconds_total",
+                "counter",
+                "Time the drawn ticks were planned to take",
+                [("", self.planned_secs)],
+            ),
+            (
+                "eas_drawing_seconds_total",
+                "counter",
+                "Time the drawn ticks took",
+                [("", self.drawing_secs)],
+            ),
+            (
+                "eas_timing_slip_ratio",
+                "gauge",
+                "Seconds taken per second planned",
+                [("", self.slip())],
+            ),
+            (
+                "eas_tick_lateness_seconds",
+                "gauge",
+                "How late ticks were against their deadlines",
+                [
+                    ('stat="mean"', timing.get("mean_lateness_secs", 0.0)),
+                    ('stat="jitter"', timing.get("jitter_secs", 0.0)),
+                    ('stat="max"', timing.get("max_lateness_secs", 0.0)),
+                ],
+            ),
+            (
+                "eas_resyncs_total",
+                "counter",
+                "Stalls the scheduler gave up catching up on",
+                [("", timing.get("resyncs", 0))],
+            ),
+        ]
+        if self.total_commands is not None:
+            metrics.append(
+                (
+                    "eas_commands",
+                    "gauge",
+                    "Commands in the job",
+                    [("", self.total_commands)],
+                )
+            )
+        if self.progress() is not None:
+            metrics.append(
+                (
+                    "eas_progress_ratio",
+                    "gauge",
+                    "Fraction of the job's ticks drawn",
+                    [("", self.progress())],
+                )
+            )
+        if self.eta_secs() is not None:
+            metrics.append(
+                (
+                    "eas_eta_seconds",
+                    "gauge",
+                    "Time left to draw the job",
+                    [("", self.eta_secs())],
+                )
+            )
+
+        lines = []
+        for name, kind, help_text, samples in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(
+                    f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(
+    telemetry: Telemetry, host: str = METRICS_HOST, port: int = METRICS_PORT
+) -> ThreadingHTTPServer:
+    """
+    Serves telemetry.metrics() at /metrics from a daemon thread
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+
+            body = telemetry.metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    if len(argv) != 2:
+        print("Nuh uh! Supply a telemetry log please")
+        return
+
+    # The latest progress of every job in a log
+    jobs = {}
+    with open(argv[1]) as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                jobs[entry["job"]] = entry
+
+    for name, entry in jobs.items():
+        progress = entry["progress"]
+        eta = entry["eta_secs"]
+        print(
+            f"{name}: {entry['event']}, {entry['commands_done']} commands, "
+            f"{'?' if progress is None else f'{progress:.0%}'} done, "
+            f"{'?' if eta is None else f'{eta / 60:.1f} min'} left, "
+            f"timing slip {entry['slip']:.2f}, backlash steps "
+            f"{entry['x_backlash_steps']} x {entry['y_backlash_steps']} y"
+        )
+
+
+if __name__ == "__main__":
+    main()
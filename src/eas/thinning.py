@@ -0,0 +1,161 @@
+import numpy as np
+from contextlib import redirect_stdout
+from io import StringIO
+from sys import argv
+
+SPUR_LENGTH = 1  # longest branch (in pixels) prune_spurs cuts off a junction
+BENCH_IMAGES = [
+    "images/cat_lines.jpg",
+    "images/cat.jpg",
+    "images/cat_good_segmentation.jpg",
+    "images/square.jpg",
+]
+
+
+def neighbours(img: np.ndarray) -> list[np.ndarray]:
+    """
+    The 8 neighbours of every pixel, clockwise from the one above (P2 to P9 in
+    Zhang and Suen's paper), with everything off the edge unset
+    """
+    padded = np.pad(img, 1)
+    height, width = img.shape
+    return [
+        padded[1 + dy : 1 + dy + height, 1 + dx : 1 + dx + width]
+        for dy, dx in [
+            (-1, 0),
+            (-1, 1),
+            (0, 1),
+            (1, 1),
+            (1, 0),
+            (1, -1),
+            (0, -1),
+            (-1, -1),
+        ]
+    ]
+
+
+def transitions(ring: list[np.ndarray]) -> np.ndarray:
+    """
+    How many times the neighbours go from unset to set, once round. A pixel on
+    a line has 2 and one where lines meet has 3 or more.
+    """
+    return sum((~ring[i] & ring[(i + 1) % 8]).astype(np.uint8) for i in range(8))
+
+
+def zhang_suen(edges: np.ndarray) -> np.ndarray:
+    """
+    Thins an edge map to lines one pixel wide, keeping them connected
+    """
+    skeleton = edges > 0
+
+    changed = True
+    while changed:
+        changed = False
+        for step in range(2):
+            ring = neighbours(skeleton)
+            p2, _, p4, _, p6, _, p8, _ = ring
+            count = sum(p.astype(np.uint8) for p in ring)
+
+            if step == 0:
+                corner = ~(p2 & p4 & p6) & ~(p4 & p6 & p8)
+            else:
+                corner = ~(p2 & p4 & p8) & ~(p2 & p6 & p8)
+
+            remove = (
+                skeleton
+                & (count >= 2)
+                & (count <= 6)
+                & (transitions(ring) == 1)
+                & corner
+            )
+            if remove.any():
+                skeleton &= ~remove
+                changed = True
+
+    return skeleton.astype(edges.dtype) * edges.max(initial=0)
+
+
+def prune_spurs(skeleton: np.ndarray, spur_length: int = SPUR_LENGTH) -> np.ndarray:
+    """
+    Removes branches of at most spur_length pixels that stick out from where
+    lines meet. Lines that end without meeting another are left alone, however
+    short.
+    """
+    pruned = skeleton > 0
+    height, width = pruned.shape
+    junction = pruned & (transitions(neighbours(pruned)) >= 3)
+    # Ends have all their neighbours on one side
+    ends = pruned & (transitions(neighbours(pruned)) == 1)
+
+    for y, x in np.argwhere(ends).tolist():
+        branch = [(y, x)]
+        following = []
+        while len(branch) <= spur_length:
+            y, x = branch[-1]
+            following = [
+                (y + dy, x + dx)
+                for dy in (-1, 0, 1)
+                for dx in (-1, 0, 1)
+                if 0 <= y + dy < height
+                and 0 <= x + dx < width
+                and pruned[y + dy, x + dx]
+                and (y + dy, x + dx) not in branch
+            ]
+            if len(following) != 1 or junction[following[0]]:
+                break
+            branch.append(following[0])
+
+        # Anything else ran out of line or was too long to be a spur
+        meets = len(following) > 1 or (following and junction[following[0]])
+        if meets and len(branch) <= spur_length:
+            for point in branch:
+                pruned[point] = False
+
+    return pruned.astype(skeleton.dtype) * skeleton.max(initial=0)
+
+
+def thin(edges: np.ndarray, spur_length: int = SPUR_LENGTH) -> np.ndarray:
+    return prune_spurs(zhang_suen(edges), spur_length)
+
+
+def main():
+    if len(argv) > 2:
+        print("Nuh uh! Supply nothing or a spur length please")
+        return
+
+    # How much thinning saves the default planner on the bundled images
+    import image
+    import simulate
+    import toolpath
+    from command import START_OFFSET_STEPS, motor_commands
+    from constants import STEPS_PER_PIXEL
+    from cost import CostModel
+
+    spur_length = int(argv[1]) if len(argv) == 2 else SPUR_LENGTH
+    origin = (START_OFFSET_STEPS, START_OFFSET_STEPS)
+
+    for img_path in BENCH_IMAGES:
+        edges = image.canny(img_path, image.screen_resolution())
+        thinned = thin(edges, spur_length)
+
+        secs = []
+        for planned in (edges, thinned):
+            with redirect_stdout(StringIO()):
+                commands = toolpath.generate_toolpath(planned.copy(), CostModel())
+            stats, _ = simulate.simulate(
+                motor_commands(commands), planned, STEPS_PER_PIXEL, origin
+            )
+            secs.append(stats["draw_secs"])
+
+        before = np.count_nonzero(edges)
+        removed = before - np.count_nonzero(thinned)
+        print(
+            f"{img_path}: removed {removed} of {before} pixels "
+            f"({removed / max(before, 1):.1%}), "
+            f"draws in {secs[1]:.0f} s instead of {secs[0]:.0f} s, "
+            f"saving {secs[0] - secs[1]:.0f} s ({1 - secs[1] / max(secs[0], 1e-9):.1%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import numpy as np
+from collections.abc import Iterable, Iterator
+from sys import argv
+from command import (
+    Command,
+    Move,
+    iter_jsonl,
+    motor_commands,
+    write_commands,
+)
+from constants import STEPS_PER_PIXEL
+
+# Packed command file: one header, then one fixed size record per command, all
+# little endian so the records can be memory mapped straight off the disk
+MAGIC = b"EASTOOLF"
+VERSION = 1
+SUFFIX = ".eas"
+CHUNK_SIZE = 4096  # records converted to commands (or back) at a time
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u2"),
+        # Resolution of the image the path was planned on, 0 when unknown
+        ("width", "<u4"),
+        ("height", "<u4"),
+        ("steps_per_pixel", "<u4"),
+        ("count", "<u8"),
+    ]
+)
+
+COMMAND = 0  # x, y are directions, steps the number of steps
+MOVE = 1  # x, y are dx, dy and steps is unused
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("kind", "u1"),
+        ("x", "<i4"),
+        ("y", "<i4"),
+        ("steps", "<i4"),
+    ]
+)
+
+
+def to_records(commands: list[Command | Move]) -> np.ndarray:
+    records = np.zeros(len(commands), RECORD_DTYPE)
+    records[:] = [
+        (MOVE, com.dx, com.dy, 0)
+        if isinstance(com, Move)
+        else (COMMAND, com.x, com.y, com.steps)
+        for com in commands
+    ]
+    return records
+
+
+def from_records(records: np.ndarray) -> list[Command | Move]:
+    return [
+        Move(dx=x, dy=y) if kind == MOVE else Command(x=x, y=y, steps=steps)
+        for kind, x, y, steps in records.tolist()
+    ]
+
+
+def write_toolfile(
+    filename: str,
+    commands: Iterable[Command | Move],
+    width: int,
+    height: int,
+    steps_per_pixel: int = STEPS_PER_PIXEL,
+) -> int:
+    """
+    Writes commands as they are (motor steps) to a packed file, planned on an
+    image width x height (0 x 0 if that's not known). Commands can come from
+    a generator, they're written a chunk at a time and the count in the
+    header is filled in at the end. Returns the number written.
+    """
+    header = np.zeros(1, HEADER_DTYPE)
+    header[0] = (MAGIC, VERSION, width, height, steps_per_pixel, 0)
+
+    count = 0
+    with open(filename, "wb") as file:
+        header.tofile(file)
+
+        chunk = []
+        for com in commands:
+            chunk.append(com)
+            if len(chunk) == CHUNK_SIZE:
+                to_records(chunk).tofile(file)
+                count += len(chunk)
+                chunk = []
+        to_records(chunk).tofile(file)
+        count += len(chunk)
+
+        header[0]["count"] = count
+        file.seek(0)
+        header.tofile(file)
+
+    return count
+
+
+def save_toolfile(
+    filename: str,
+    commands: list[Command | Move],
+    width: int,
+    height: int,
+):
+    """
+    Writes pixel commands as a packed file of motor steps, like
+    command.save_commands does for JSONL
+    """
+    write_toolfile(filename, motor_commands(commands), width, height)
+
+
+def read_header(filename: str) -> dict:
+    header = np.fromfile(filename, HEADER_DTYPE, count=1)
+    if len(header) == 0 or header[0]["magic"] != MAGIC:
+        raise ValueError(f"{filename} is not a toolpath file")
+    if header[0]["version"] != VERSION:
+        raise ValueError(
+            f"{filename} is version {header[0]['version']}, expected {VERSION}"
+        )
+
+    return {name: header[0][name].item() for name in HEADER_DTYPE.names}
+
+
+def open_toolfile(filename: str) -> tuple[dict, np.ndarray]:
+    """
+    Returns the header and the records memory mapped read only, nothing is
+    read until it's used
+    """
+    header = read_header(filename)
+    if header["count"] == 0:
+        return header, np.zeros(0, RECORD_DTYPE)
+
+    records = np.memmap(
+        filename,
+        RECORD_DTYPE,
+        mode="r",
+        offset=HEADER_DTYPE.itemsize,
+        shape=(header["count"],),
+    )
+    return header, records
+
+
+def is_toolfile(filename: str) -> bool:
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def planned_size(filename: str) -> tuple[int, int]:
+    """
+    Width and height of the image a command file was planned on, 0 x 0 for
+    JSONL, which doesn't say
+    """
+    if not is_toolfile(filename):
+        return 0, 0
+    header = read_header(filename)
+    return header["width"], header["height"]
+
+
+def iter_commands(filename: str) -> Iterator[Command | Move]:
+    """
+    Streams the commands in a packed or JSONL file, without loading the
+    whole file
+    """
+    if not is_toolfile(filename):
+        yield from iter_jsonl(filename)
+        return
+
+    _, records = open_toolfile(filename)
+    for start in range(0, len(records), CHUNK_SIZE):
+        yield from from_records(records[start : start + CHUNK_SIZE])
+
+
+def load_commands(filename: str) -> list[Command | Move]:
+    return list(iter_commands(filename))
+
+
+def main():
+    if len(argv) != 3:
+        print("Nuh uh! Supply an input and an output file please")
+        return
+
+    # Converts whichever way round the files are
+    if argv[2].endswith(SUFFIX):
+        count = write_toolfile(argv[2], iter_commands(argv[1]), *planned_size(argv[1]))
+    else:
+        count = write_commands(argv[2], iter_commands(argv[1]))
+
+    print(f"Converted {count} commands")
+
+
+if __name__ == "__main__":
+    main()
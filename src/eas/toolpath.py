@@ -1,89 +1,131 @@
-import json
 import numpy as np
 from collections import deque
-from command import Command
+from collections.abc import Iterator
+from command import Command, Move, save_commands
 from constants import DIRECTIONS
+from cost import CostModel, axis_reversals, command_state
+from drawn_index import DrawnIndex
+from lines import fit_moves, simplify
+from pixel_index import PixelIndex
+from profiler import PhaseProfiler, phase
+
+PLANNER_VERSION = 3  # goes into cache keys, bump it when planned output changes
+
+
+def generate_toolpath(
+    img: np.ndarray,
+    cost_model: CostModel | None = None,
+    fit_tolerance: float | None = None,
+    start: tuple[int, int] = (0, 0),
+    simplify_tolerance: float | None = None,
+    profiler: PhaseProfiler | None = None,
+) -> list[Command | Move]:
+    """
+    With a cost model, strokes are followed in the direction and jumps are
+    routed along the lines that cost the least backlash. With a fit tolerance,
+    runs of commands that stay that close to a straight line become Moves.
+    With a simplify tolerance, the whole path is simplified to the fewest
+    segments that stay that close to it (see lines.simplify).
+    The pen starts at start, (y, x). A profiler records where the time goes.
+    """
+    commands = list(iter_toolpath(img, cost_model, start, profiler))
 
+    if simplify_tolerance is not None:
+        with phase(profiler, "simplify"):
+            commands = simplify(commands, simplify_tolerance)
+    if fit_tolerance is not None:
+        with phase(profiler, "fit_moves"):
+            return fit_moves(commands, fit_tolerance)
 
-def generate_toolpath(img: np.ndarray) -> list[Command]:
-    commands = []
+    return commands
+
+
+def iter_toolpath(
+    img: np.ndarray,
+    cost_model: CostModel | None = None,
+    start: tuple[int, int] = (0, 0),
+    profiler: PhaseProfiler | None = None,
+) -> Iterator[Command | Move]:
+    """
+    Plans the toolpath a stroke at a time, yielding each command as soon as
+    it's planned, see generate_toolpath
+    """
+    with phase(profiler, "index"):
+        index = PixelIndex(img, drawn=DrawnIndex(img))
+    state = (0, 0)
 
-    current_point = (0, 0)
-    while np.any(img == 255):
+    current_point = start
+    while index.remaining > 0:
         prev_point = current_point
-        point, img = find_next_point(img, current_point)
+        with phase(profiler, "find_next_point"):
+            point, img = find_next_point(img, current_point, index)
 
-        next_point_commands, img = gen_path_to_next_point(prev_point, point, img)
-        commands = commands + next_point_commands
+        with phase(profiler, "gen_path_to_next_point"):
+            next_point_commands, img = gen_path_to_next_point(
+                prev_point, point, img, index, state, cost_model
+            )
+        if profiler is not None:
+            jump = max(abs(point[0] - prev_point[0]), abs(point[1] - prev_point[1]))
+            profiler.observe("jump_distance", jump)
+            profiler.observe("bfs_size", index.drawn.searched)
+            profiler.touched(
+                "gen_path_to_next_point",
+                index.drawn.searched + sum(com.steps for com in next_point_commands),
+            )
+        yield from next_point_commands
+        state = command_state(next_point_commands, state)
+        # Only matters when the pen already sits on the point (no line was drawn)
+        index.mark(point)
 
         current_point = point
-        adjacent, direction = cross_x_search(current_point, img)
+        with phase(profiler, "cross_x_search"):
+            adjacent, direction = cross_x_search(current_point, img, state, cost_model)
         while adjacent:
-            command, current_point, img = gen_line_command(
-                direction, current_point, img
-            )
+            with phase(profiler, "gen_line_command"):
+                command, current_point, img = gen_line_command(
+                    direction, current_point, img, index
+                )
+            if profiler is not None:
+                profiler.touched("gen_line_command", command.steps)
 
-            commands.append(command)
+            yield command
+            state = command_state([command], state)
 
-            adjacent, direction = cross_x_search(current_point, img)
-
-    return commands
+            with phase(profiler, "cross_x_search"):
+                adjacent, direction = cross_x_search(
+                    current_point, img, state, cost_model
+                )
 
 
 def gen_path_to_next_point(
-    current_point: tuple[int, int], next_point: tuple[int, int], img: np.ndarray
+    current_point: tuple[int, int],
+    next_point: tuple[int, int],
+    img: np.ndarray,
+    index: PixelIndex | None = None,
+    state: tuple[int, int] = (0, 0),
+    cost_model: CostModel | None = None,
 ) -> tuple[list[Command], np.ndarray]:
     """
     Moves from current_point to next_point in two phases:
     1. Follows existing drawn pixels (value 1) to get as close as possible.
     2. Draws a new line (diagonal + straight) to reach the target,
        marking traversed pixels as 1.
+
+    With a cost model, "as close as possible" becomes the drawn pixel with the
+    cheapest route: retraced steps and reversals on the way, plus the new line
+    weighted by stray_cost. state is the axis directions the pen last moved in.
     """
     commands = []
-    height, width = img.shape
 
     # follow existing path
-    queue = deque([current_point])
-    visited_bfs: set[tuple[int, int]] = {current_point}
-    parent_map: dict[tuple[int, int], tuple[int, int]] = {current_point: None}
-
-    closest_pos_on_path = current_point
-    min_dist_sq = (next_point[0] - current_point[0]) ** 2 + (
-        next_point[1] - current_point[1]
-    ) ** 2
-
-    while queue:
-        y, x = queue.popleft()
-
-        # Check if this point is closer to the target
-        dist_sq = (next_point[0] - y) ** 2 + (next_point[1] - x) ** 2
-        if dist_sq < min_dist_sq:
-            min_dist_sq = dist_sq
-            closest_pos_on_path = (y, x)
-
-        # Explore neighbors
-        for dy, dx in DIRECTIONS:
-            ny, nx = y + dy, x + dx
-            neighbor = (ny, nx)
-
-            # Check if we've seen it in this BFS, and if it's a '1' pixel
-            if (
-                0 <= ny < height
-                and 0 <= nx < width
-                and neighbor not in visited_bfs
-                and img[ny, nx] == 1
-            ):  # Only follow existing path
-                visited_bfs.add(neighbor)
-                parent_map[neighbor] = (y, x)
-                queue.append(neighbor)
-
-    # reconstruct path
-    path: list[tuple[int, int]] = []
-    curr = closest_pos_on_path
-    while curr is not None:
-        path.append(curr)
-        curr = parent_map.get(curr)
-    path.reverse()  # Path is now [current_pos, step1, ..., closest_pos_on_path]
+    drawn = index.drawn if index is not None else None
+    if drawn is None:
+        path = search_drawn_path(current_point, next_point, img, state, cost_model)
+    elif cost_model is None:
+        path = drawn.route(current_point, drawn.closest(current_point, next_point))
+    else:
+        path = drawn.cheapest_route(current_point, next_point, state, cost_model)
+    closest_pos_on_path = path[-1]
 
     # Convert path into commands
     i = 0
@@ -131,7 +173,11 @@ def gen_path_to_next_point(
         commands.append(Command(x=dir_x, y=dir_y, steps=diag_steps))
         # Mark traveled pixels as '1'
         for i in range(1, diag_steps + 1):
-            img[current_point[0] + (dir_y * i), current_point[1] + (dir_x * i)] = 1
+            mark_pixel(
+                img,
+                (current_point[0] + (dir_y * i), current_point[1] + (dir_x * i)),
+                index,
+            )
 
         # Update current_pos
         current_point = (
@@ -151,13 +197,113 @@ def gen_path_to_next_point(
 
         # Mark traveled pixels as '1'
         for i in range(1, adj_steps + 1):
-            img[
-                current_point[0] + (adj_dir_y * i), current_point[1] + (adj_dir_x * i)
-            ] = 1
+            mark_pixel(
+                img,
+                (
+                    current_point[0] + (adj_dir_y * i),
+                    current_point[1] + (adj_dir_x * i),
+                ),
+                index,
+            )
 
     return commands, img
 
 
+def search_drawn_path(
+    current_point: tuple[int, int],
+    next_point: tuple[int, int],
+    img: np.ndarray,
+    state: tuple[int, int] = (0, 0),
+    cost_model: CostModel | None = None,
+) -> list[tuple[int, int]]:
+    """
+    Breadth first search over every drawn pixel reachable from current_point
+    for the one closest to next_point, returns the path there. Used when
+    there's no DrawnIndex to ask.
+    """
+    height, width = img.shape
+
+    # follow existing path
+    queue = deque([current_point])
+    visited_bfs: set[tuple[int, int]] = {current_point}
+    parent_map: dict[tuple[int, int], tuple[int, int]] = {current_point: None}
+    # axis directions, steps and reversals along the BFS route to each pixel
+    route_map = {current_point: (state, 0, 0)}
+
+    closest_pos_on_path = current_point
+    min_dist_sq = (next_point[0] - current_point[0]) ** 2 + (
+        next_point[1] - current_point[1]
+    ) ** 2
+    min_cost = None
+
+    while queue:
+        y, x = queue.popleft()
+
+        if cost_model is not None:
+            route_state, route_steps, route_reversals = route_map[(y, x)]
+            dy, dx = next_point[0] - y, next_point[1] - x
+            line_reversals, _ = axis_reversals(
+                route_state, int(np.sign(dx)), int(np.sign(dy))
+            )
+            cost = (
+                route_steps
+                + (route_reversals + (line_reversals > 0)) * cost_model.reversal_cost
+                + max(abs(dy), abs(dx)) * cost_model.stray_cost
+            )
+            if min_cost is None or cost < min_cost:
+                min_cost = cost
+                closest_pos_on_path = (y, x)
+        else:
+            # Check if this point is closer to the target
+            dist_sq = (next_point[0] - y) ** 2 + (next_point[1] - x) ** 2
+            if dist_sq < min_dist_sq:
+                min_dist_sq = dist_sq
+                closest_pos_on_path = (y, x)
+
+        # Explore neighbors
+        for dy, dx in DIRECTIONS:
+            ny, nx = y + dy, x + dx
+            neighbor = (ny, nx)
+
+            # Check if we've seen it in this BFS, and if it's a '1' pixel
+            if (
+                0 <= ny < height
+                and 0 <= nx < width
+                and neighbor not in visited_bfs
+                and img[ny, nx] == 1
+            ):  # Only follow existing path
+                visited_bfs.add(neighbor)
+                parent_map[neighbor] = (y, x)
+                queue.append(neighbor)
+
+                if cost_model is not None:
+                    reversed_axes, neighbor_state = axis_reversals(route_state, dx, dy)
+                    route_map[neighbor] = (
+                        neighbor_state,
+                        route_steps + 1,
+                        route_reversals + (reversed_axes > 0),
+                    )
+
+    # reconstruct path
+    path: list[tuple[int, int]] = []
+    curr = closest_pos_on_path
+    while curr is not None:
+        path.append(curr)
+        curr = parent_map.get(curr)
+    path.reverse()  # Path is now [current_pos, step1, ..., closest_pos_on_path]
+
+    return path
+
+
+def mark_pixel(
+    img: np.ndarray, point: tuple[int, int], index: PixelIndex | None = None
+):
+    if index is not None:
+        index.mark(point)
+    else:
+        img[point] = 1
+
+
 def add_border(img: np.ndarray) -> np.ndarray:
     height, width = img.shape
 
@@ -170,33 +316,49 @@ def add_border(img: np.ndarray) -> np.ndarray:
 
 
 def cross_x_search(
-    point: tuple[int, int], img: np.ndarray
+    point: tuple[int, int],
+    img: np.ndarray,
+    state: tuple[int, int] = (0, 0),
+    cost_model: CostModel | None = None,
 ) -> tuple[bool, tuple[int, int]]:
     """
     Returns found_bool, direction,
+    With a cost model, prefers directions that don't reverse an axis
     """
     check_order = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
 
+    found = None
     for to_check in check_order:
         current_point = (point[0] + to_check[0], point[1] + to_check[1])
         if img[current_point[0], current_point[1]] >= 255:
-            return True, to_check
+            if cost_model is None:
+                return True, to_check
+
+            reversed_axes, _ = axis_reversals(state, to_check[1], to_check[0])
+            if found is None or reversed_axes < found[0]:
+                found = (reversed_axes, to_check)
+
+    if found is not None:
+        return True, found[1]
 
     return False, (0, 0)
 
 
 def gen_line_command(
-    direction: tuple[int, int], point: tuple[int, int], img: np.ndarray
+    direction: tuple[int, int],
+    point: tuple[int, int],
+    img: np.ndarray,
+    index: PixelIndex | None = None,
 ) -> tuple[Command, tuple[int, int], np.ndarray]:
     """
-    Remember to lower white_pixel_cound by num of steps in command
+    Pass index to keep the remaining pixel count in sync
     """
     step_count = 0
     prev_point = point
     next_point = (point[0] + direction[0], point[1] + direction[1])
     while img[next_point] == 255:
         step_count += 1
-        img[next_point] = 1
+        mark_pixel(img, next_point, index)
         prev_point = next_point
         next_point = (next_point[0] + direction[0], next_point[1] + direction[1])
 
@@ -204,8 +366,13 @@ def gen_line_command(
 
 
 def find_next_point(
-    img: np.ndarray, origin: tuple[int, int] = (0, 0)
+    img: np.ndarray,
+    origin: tuple[int, int] = (0, 0),
+    index: PixelIndex | None = None,
 ) -> tuple[tuple[int, int], np.ndarray]:
+    if index is not None:
+        return index.nearest(origin), img
+
     height, width = img.shape
     y, x = origin
     max_radius = max(height, width)
@@ -240,18 +407,17 @@ def find_next_point(
 
 if __name__ == "__main__":
     import image
-
-    coms = generate_toolpath(image.canny("images/cat_lines.jpg"))
-    with open("cat.jsonl", "w") as file:
-        file.write('{"steps": 8192, "x_dir": 1, "y_dir": 1}\n')
-
-        for com in coms:
-            STEPS_PER_PIXEL = 100
-            inst = {
-                "steps": abs(com.steps) * STEPS_PER_PIXEL,
-                "x_dir": com.x,
-                "y_dir": com.y,
-            }
-            file.write(f"{json.dumps(inst)}\n")
-            print(f"x: {com.x}, y: {com.y}, steps: {com.steps}")
-        print(f"Length: {len(coms)}")
+    from cost import reversals
+
+    edges = image.canny("images/cat_lines.jpg")
+    coms = generate_toolpath(edges.copy(), CostModel())
+    save_commands("cat.jsonl", coms)
+    for com in coms:
+        print(f"x: {com.x}, y: {com.y}, steps: {com.steps}")
+    print(f"Length: {len(coms)}")
+
+    plain_reversals = reversals(generate_toolpath(edges.copy()))
+    print(
+        f"Reversals: {reversals(coms)}, "
+        f"{plain_reversals - reversals(coms)} avoided by the cost model"
+    )
@@ -1,7 +1,6 @@
 import turtle
-from constants import SCREEN_HEIGHT_MM, SCREEN_WIDTH_MM
-from command import Command
-import json
+from command import Command, Move, delta
+from toolfile import load_commands
 from sys import argv
 
 t = turtle.Turtle()
@@ -9,25 +8,12 @@ t = turtle.Turtle()
 STEPS_PER_MM = 50
 
 
-def load_file(filename: str) -> list[Command]:
-    commands = []
-    with open(filename, "r") as file:
-        lines = file.readlines()
-        for line in lines:
-            inst = json.loads(line)
-            commands.append(
-                Command(x=inst["x_dir"], y=inst["y_dir"], steps=inst["steps"])
-            )
-
-    return commands
-
-
 def main():
     if len(argv) != 2:
         print("Nuh uh! Supply a single argument please")
         return
 
-    commands = load_file(argv[1])
+    commands = load_commands(argv[1])
 
     setup_turtle()
     draw_commands(commands)
@@ -50,12 +36,13 @@ def setup_turtle():
     # set_position(0, 0)
 
 
-def draw_commands(commands: list[Command]):
+def draw_commands(commands: list[Command | Move]):
     current_x = 0
     current_y = 0
     for command in commands:
-        current_x += (command.steps / STEPS_PER_MM) * command.x
-        current_y += (command.steps / STEPS_PER_MM) * command.y
+        dx, dy = delta(command)
+        current_x += dx / STEPS_PER_MM
+        current_y += dy / STEPS_PER_MM
         set_position(current_x, current_y)
     turtle.update()
 